@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# ansi.py
+#
+# Times printing a scaled up copy of tests/data/code.py to a terminal
+# through the Rich library against writing the ANSI escape sequences
+# directly with to_ansi()
+import argparse
+import io
+import timeit
+
+from pathlib import Path
+
+from rich.console import Console
+
+from purdy.content import Code, Document
+from purdy.renderers.ansi import to_ansi
+from purdy.renderers.rich import to_rich, to_rich_text
+
+# =============================================================================
+
+def rich_console():
+    return Console(file=io.StringIO(), force_terminal=True, width=200,
+        color_system="truecolor", highlight=False)
+
+
+def print_rich(doc):
+    rich_console().print(to_rich(doc))
+
+
+def print_rich_text(doc):
+    rich_console().print(to_rich_text(doc))
+
+
+def ansi_printer(depth):
+    def print_ansi(doc):
+        to_ansi(doc, depth, file=io.StringIO())
+
+    return print_ansi
+
+
+PRINTERS = {
+    "rich": print_rich,
+    "rich_text": print_rich_text,
+    "ansi": ansi_printer("truecolor"),
+    "ansi256": ansi_printer("256"),
+    "ansi16": ansi_printer("16"),
+}
+
+DATA = Path(__file__).parent.parent.parent / "tests/data/code.py"
+
+def build_document(count):
+    lines = DATA.read_text().splitlines(keepends=True)
+    while len(lines) < count:
+        lines.extend(lines)
+
+    code = Code.text("".join(lines[:count]))
+
+    # Highlight every tenth line, partially highlight every seventh
+    for index in range(0, len(code.lines), 10):
+        code.highlight(index)
+
+    for index in range(3, len(code.lines), 7):
+        code.highlight(f"{index}:4,6")
+
+    doc = Document(code)
+    doc.line_numbers_enabled = True
+    return doc
+
+# =============================================================================
+
+parser = argparse.ArgumentParser(description=("Times printing to a terminal "
+    "with and without Rich"))
+parser.add_argument("-n", "--lines", type=int, default=5000,
+    help="Number of lines to print. Defaults to 5000")
+parser.add_argument("-r", "--repeat", type=int, default=3,
+    help="Number of runs, best is reported. Defaults to 3")
+args = parser.parse_args()
+
+doc = build_document(args.lines)
+lines = len(doc[0].lines)
+for name, printer in PRINTERS.items():
+    elapsed = min(timeit.repeat(lambda: printer(doc), number=1,
+        repeat=args.repeat))
+    print(f"{name:9} {elapsed * 1000:8.1f}ms  "
+        f"({elapsed / lines * 1e6:.1f}us per line)")
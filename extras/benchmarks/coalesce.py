@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# coalesce.py
+#
+# Compares the number of parts and the rendering time of code parsed with
+# and without the Parser's coalescing mode
+import argparse
+import os
+import timeit
+
+from pathlib import Path
+
+from purdy.content import Code
+from purdy.parser import Parser
+from purdy.renderers.html import to_html
+from purdy.renderers.rtf import to_rtf
+
+# =============================================================================
+
+RENDERERS = {
+    "html": to_html,
+    "rtf": to_rtf,
+}
+
+def load(content, lexer, coalesce):
+    Parser.coalesce = coalesce
+    try:
+        return Code.text(content, lexer)
+    finally:
+        Parser.coalesce = False
+
+# =============================================================================
+
+parser = argparse.ArgumentParser(description=("Compares parsing with and "
+    "without coalescing"))
+parser.add_argument("files", nargs="*", help=("Files to parse. Defaults to "
+    "a selection of modules from the standard library"))
+parser.add_argument("-l", "--lexer", default="py",
+    help="Name of the lexer to use. Defaults to 'py'")
+parser.add_argument("-r", "--repeat", type=int, default=3,
+    help="Number of runs, best is reported. Defaults to 3")
+args = parser.parse_args()
+
+if args.files:
+    paths = [Path(name) for name in args.files]
+else:
+    paths = sorted(Path(os.__file__).parent.glob("*.py"))[:5]
+
+content = "".join(path.read_text(encoding="utf-8", errors="replace")
+    for path in paths)
+
+plain = load(content, args.lexer, False)
+merged = load(content, args.lexer, True)
+
+plain_count = sum(len(line.parts) for line in plain.lines)
+merged_count = sum(len(line.parts) for line in merged.lines)
+print(f"parts  plain {plain_count:9}  coalesced {merged_count:9}  "
+    f"({merged_count / plain_count:.1%})")
+
+for name, renderer in RENDERERS.items():
+    before = min(timeit.repeat(lambda: renderer(plain), number=1,
+        repeat=args.repeat))
+    after = min(timeit.repeat(lambda: renderer(merged), number=1,
+        repeat=args.repeat))
+    print(f"{name:5}  plain {before:8.3f}s  coalesced {after:8.3f}s  "
+        f"({before / after:.2f}x)")
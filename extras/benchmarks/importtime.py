@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+# importtime.py
+#
+# Reports the cost of importing purdy modules using "python -X importtime",
+# best of several runs, with the slowest imports underneath
+import argparse
+import subprocess
+import sys
+
+# =============================================================================
+
+def import_time(module):
+    # Returns (total microseconds, {module: cumulative microseconds})
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c",
+        f"import {module}"], capture_output=True, text=True, check=True)
+
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+
+        _, cumulative, name = line[len("import time:"):].split("|")
+        times[name.strip()] = int(cumulative)
+
+    return times[module], times
+
+# =============================================================================
+
+parser = argparse.ArgumentParser(description=("Measures import time of purdy "
+    "modules"))
+parser.add_argument("modules", nargs="*", default=["purdy.parser"],
+    help="Modules to import. Defaults to purdy.parser")
+parser.add_argument("-r", "--repeat", type=int, default=5,
+    help="Number of runs, best is reported. Defaults to 5")
+parser.add_argument("-t", "--top", type=int, default=10,
+    help="Number of slowest imports to show. Defaults to 10")
+args = parser.parse_args()
+
+for module in args.modules:
+    total, times = min(import_time(module) for _ in range(args.repeat))
+    print(f"{module}: {total / 1000:.1f}ms")
+
+    slowest = sorted(times.items(), key=lambda item: item[1], reverse=True)
+    for name, cumulative in slowest[1:args.top + 1]:
+        print(f"    {cumulative / 1000:7.1f}ms  {name}")
@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+# pylexer.py
+#
+# Compares the throughput of the Pygments PythonLexer with purdy's
+# tokenize based lexer, parsing Python source into Code objects
+import argparse
+import os
+import time
+
+from pathlib import Path
+
+from purdy.content import Code
+
+# =============================================================================
+
+def measure(content, lexer, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        Code.text(content, lexer)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+
+    return best
+
+# =============================================================================
+
+parser = argparse.ArgumentParser(description=("Compares Python lexer "
+    "throughput"))
+parser.add_argument("files", nargs="*", help=("Python files to parse. "
+    "Defaults to the modules in the standard library directory"))
+parser.add_argument("-r", "--repeat", type=int, default=3,
+    help="Number of runs, best is reported. Defaults to 3")
+args = parser.parse_args()
+
+if args.files:
+    paths = [Path(name) for name in args.files]
+else:
+    paths = sorted(Path(os.__file__).parent.glob("*.py"))
+
+content = "\n".join(path.read_text(errors="replace") for path in paths)
+lines = content.count("\n")
+size = len(content.encode()) / 1024 / 1024
+print(f"{len(paths)} files, {lines} lines, {size:.1f}MB")
+
+for lexer in ["py", "pyfast"]:
+    elapsed = measure(content, lexer, args.repeat)
+    print(f"{lexer:6} {elapsed:6.2f}s  {lines / elapsed:9.0f} lines/s  "
+        f"{size / elapsed:5.2f}MB/s")
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# render.py
+#
+# Times rendering a scaled up copy of tests/data/code.py with each of the
+# string based renderers, with line numbers, wrapping and highlighting on
+import argparse
+import timeit
+
+from pathlib import Path
+
+from purdy.content import Code, Document
+from purdy.renderers.html import to_html
+from purdy.renderers.plain import to_plain
+from purdy.renderers.rich import to_rich
+from purdy.renderers.rtf import to_rtf
+
+# =============================================================================
+
+RENDERERS = {
+    "plain": to_plain,
+    "html": to_html,
+    "rtf": to_rtf,
+    "rich": to_rich,
+}
+
+DATA = Path(__file__).parent.parent.parent / "tests/data/code.py"
+
+def build_document(scale):
+    code = Code.text(DATA.read_text() * scale)
+
+    # Highlight every tenth line, partially highlight every seventh
+    for index in range(0, len(code.lines), 10):
+        code.highlight(index)
+
+    for index in range(3, len(code.lines), 7):
+        code.highlight(f"{index}:4,6")
+
+    doc = Document(code)
+    doc.line_numbers_enabled = True
+    doc.wrap = 80
+    return doc
+
+# =============================================================================
+
+parser = argparse.ArgumentParser(description="Times the renderers")
+parser.add_argument("-s", "--scale", type=int, default=20,
+    help=("Number of copies of tests/data/code.py to render. Defaults to "
+        "20"))
+parser.add_argument("-r", "--repeat", type=int, default=5,
+    help="Number of runs, best is reported. Defaults to 5")
+args = parser.parse_args()
+
+doc = build_document(args.scale)
+lines = len(doc[0].lines)
+for name, renderer in RENDERERS.items():
+    elapsed = min(timeit.repeat(lambda: renderer(doc), number=1,
+        repeat=args.repeat))
+    print(f"{name:5} {elapsed * 1000:8.1f}ms  "
+        f"({elapsed / lines * 1e6:.1f}us per line)")
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# rtf_encode.py
+#
+# Measures the throughput of RTFFormatter.rtf_encode() against the
+# character by character UTF-16 encoder it replaced, on ASCII, Latin-1 and
+# mixed unicode text, and on the parts of a parsed source file
+import argparse
+import struct
+import timeit
+
+from pathlib import Path
+
+from purdy.content import Code
+from purdy.renderers.rtf import RTFFormatter
+
+# =============================================================================
+
+def old_encode(text):
+    ### The original encoder: unpacks the UTF-16 words and escapes them one
+    # at a time
+    output = []
+    data = text.encode('utf-16le')
+    length = len(data) // 2
+    parts = struct.unpack(f'<{length}H', data)
+    index = 0
+    size = len(parts)
+
+    while index < size:
+        num = parts[index]
+
+        if num <= 127:
+            letter = chr(num)
+            if letter == '\\':
+                output.append('\\\\')
+            elif letter in '{}':
+                output.append('\\' + letter)
+            else:
+                output.append(letter)
+        elif num <= 256:
+            output.append(f"\\'{num:2x}" )
+        elif num < 55296:
+            output.append(f"\\uc0\\u{num}")
+        else:
+            index += 1
+            next_num = parts[index]
+            output.append(f"\\uc0\\u{num} \\u{next_num}")
+
+        index += 1
+
+    return ''.join(output)
+
+
+ENCODERS = {
+    "old": old_encode,
+    "new": RTFFormatter.rtf_encode,
+}
+
+DATA = Path(__file__).parent.parent.parent / "tests/data/code.py"
+
+def build_samples(scale):
+    code = Code.text(DATA.read_text() * scale)
+    parts = [part.text for line in code.lines for part in line.parts]
+
+    # Each sample is a list of strings, the size of typical parts
+    return {
+        "parts": parts,
+        "ascii": ["def thing(x): return {x}\\n"] * (len(parts) // 4),
+        "latin1": ["café déjà vu ñ"] * (len(parts) // 4),
+        "unicode": ["αβγ → 😂 ok"] * (len(parts) // 4),
+    }
+
+# =============================================================================
+
+parser = argparse.ArgumentParser(description=("Times the RTF unicode "
+    "encoder"))
+parser.add_argument("-s", "--scale", type=int, default=20,
+    help=("Number of copies of tests/data/code.py to use for the 'parts' "
+        "sample. Defaults to 20"))
+parser.add_argument("-r", "--repeat", type=int, default=5,
+    help="Number of runs, best is reported. Defaults to 5")
+args = parser.parse_args()
+
+for name, sample in build_samples(args.scale).items():
+    size = sum(len(text) for text in sample)
+    results = {}
+    for encoder_name, encoder in ENCODERS.items():
+        results[encoder_name] = [encoder(text) for text in sample]
+        elapsed = min(timeit.repeat(
+            lambda: [encoder(text) for text in sample],
+            number=1, repeat=args.repeat))
+        print(f"{name:8} {encoder_name}  {elapsed * 1000:8.2f}ms  "
+            f"({size / elapsed / 1e6:6.1f}M chars/s)")
+
+    if results["old"] != results["new"]:
+        print(f"*** {name}: output differs")
@@ -0,0 +1,49 @@
+#!/usr/bin/env python
+# snippets.py
+#
+# Benchmarks parsing lots of tiny snippets with Code.text(), comparing
+# re-using pooled lexers against constructing a new lexer every time
+import argparse
+import timeit
+
+from purdy.content import Code
+from purdy.parser import lexer_pool
+
+# =============================================================================
+
+SNIPPETS = {
+    "py": "x = 1\n",
+    "repl": ">>> x = 1\n>>> x\n1\n",
+    "con": "$ echo hello\nhello\n",
+    "html": "<p>Hello</p>\n",
+}
+
+def run(lexer, count):
+    snippet = SNIPPETS[lexer]
+    for _ in range(count):
+        Code.text(snippet, lexer)
+
+# =============================================================================
+
+parser = argparse.ArgumentParser(description="Benchmarks lexer pooling")
+parser.add_argument("-n", "--count", type=int, default=2000,
+    help="Number of snippets to parse per run. Defaults to 2000")
+parser.add_argument("-r", "--repeat", type=int, default=5,
+    help="Number of runs, best is reported. Defaults to 5")
+args = parser.parse_args()
+
+max_free = lexer_pool.max_free
+for lexer in SNIPPETS:
+    lexer_pool.max_free = 0
+    lexer_pool.clear()
+    fresh = min(timeit.repeat(lambda: run(lexer, args.count),
+        number=1, repeat=args.repeat))
+
+    lexer_pool.max_free = max_free
+    pooled = min(timeit.repeat(lambda: run(lexer, args.count),
+        number=1, repeat=args.repeat))
+
+    fresh_us = fresh / args.count * 1e6
+    pooled_us = pooled / args.count * 1e6
+    print(f"{lexer:5} fresh {fresh_us:7.1f}us  pooled {pooled_us:7.1f}us  "
+        f"({fresh / pooled:.2f}x)")
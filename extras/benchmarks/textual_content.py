@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# textual_content.py
+#
+# Compares the per-line cost of rendering to Textual Content directly from
+# spans against building markup and having Textual parse it, which is how
+# the TextualFormatter used to work
+import argparse
+import timeit
+
+from pathlib import Path
+
+from textual.content import Content
+
+from purdy.content import Code, Document
+from purdy.parser import HighlightOn, HighlightOff, token_is_a
+from purdy.renderers.formatter import conversion_handler
+from purdy.renderers.textual import TextualFormatter, _CODE_TAG_EXCEPTIONS
+
+# =============================================================================
+
+class DirectFormatter(TextualFormatter):
+    # Rendered lines are cached by default, turn that off to time rendering
+    cache_lines = False
+
+
+class MarkupFormatter(DirectFormatter):
+    ### The markup round trip: build a markup string with a $text_N
+    # placeholder for each part, then parse it with Content.from_markup()
+    def render_code_line(self, render_state, line):
+        part_map = {}
+        markup = ""
+        highlight_on = False
+
+        for counter, part in enumerate(line.parts):
+            token = self.ancestor(part.token)
+            name = f"text_{counter}"
+            dname = "$" + name
+
+            if token_is_a(token, HighlightOff):
+                highlight_on = False
+
+            marker = self.tag_map.get(token)
+            if highlight_on or marker is None:
+                marker = dname
+            else:
+                marker = marker.replace("$text", dname)
+
+            part_map[name] = part.text
+            markup += marker
+
+            if token_is_a(token, HighlightOn):
+                highlight_on = True
+
+        if line.has_newline:
+            markup += self.newline
+
+        render_state.write(Content.from_markup(markup, **part_map))
+
+
+FORMATTERS = {
+    "markup": MarkupFormatter,
+    "direct": DirectFormatter,
+}
+
+DATA = Path(__file__).parent.parent.parent / "tests/data/code.py"
+
+def build_document(filename, count):
+    text = Path(filename).read_text()
+    lines = text.splitlines(keepends=True)
+    while len(lines) < count:
+        lines.extend(lines)
+
+    code = Code.text("".join(lines[:count]), "py")
+
+    # Highlight every tenth line, partially highlight every seventh
+    for index in range(0, len(code.lines), 10):
+        code.highlight(index)
+
+    for index in range(3, len(code.lines), 7):
+        code.highlight(f"{index}:4,6")
+
+    doc = Document(code)
+    doc.line_numbers_enabled = True
+    return doc
+
+# =============================================================================
+
+parser = argparse.ArgumentParser(description=("Times rendering to Textual "
+    "Content with and without the markup round trip"))
+parser.add_argument("filename", nargs="?", default=DATA,
+    help=("File to render, repeated as needed to get enough lines. Defaults "
+        "to tests/data/code.py"))
+parser.add_argument("-n", "--lines", type=int, default=5000,
+    help="Number of lines to render. Defaults to 5000")
+parser.add_argument("-r", "--repeat", type=int, default=5,
+    help="Number of runs, best is reported. Defaults to 5")
+args = parser.parse_args()
+
+doc = build_document(args.filename, args.lines)
+lines = len(doc[0].lines)
+
+results = {}
+for name, formatter in FORMATTERS.items():
+    results[name] = conversion_handler(formatter, doc, _CODE_TAG_EXCEPTIONS)
+    elapsed = min(timeit.repeat(lambda: conversion_handler(formatter, doc,
+        _CODE_TAG_EXCEPTIONS), number=1, repeat=args.repeat))
+    print(f"{name:6} {elapsed * 1000:8.1f}ms  "
+        f"({elapsed / lines * 1e6:.1f}us per line)")
+
+same = results["markup"].plain == results["direct"].plain
+print(f"{lines} lines, same text: {same}")
@@ -0,0 +1,198 @@
+# cache.py
+#
+# On-disk cache for parsed code, lets repeated runs skip the lexing step
+import hashlib
+import json
+import os
+
+from pathlib import Path
+
+import pygments
+from pygments.token import string_to_tokentype
+
+from purdy.__init__ import __version__
+from purdy.parser import CodeLine, CodePart, PartsList
+
+# Version of the parse results stored in the cache, bump it whenever a change
+# to the parser would produce different lines for the same content. Version 2
+# splits every token containing a newline, not just strings
+CACHE_FORMAT = 2
+
+# =============================================================================
+# Serialization Helpers
+# =============================================================================
+
+def _token_to_str(token):
+    # Pygments tokens are tuples, "Token.Name.Function" is ("Name",
+    # "Function"); the root Token is the empty tuple
+    return ".".join(token)
+
+
+def dump_lines(lines):
+    """Returns a JSON friendly structure representing the given
+    :class:`~purdy.parser.CodeLine` objects. Token types are stored once in a
+    lookup table and referenced by index.
+
+    :param lines: iterable of :class:`~purdy.parser.CodeLine` objects
+    """
+    token_ids = {}
+    tokens = []
+    output = []
+    for line in lines:
+        parts = []
+        for part in line.parts:
+            try:
+                token_id = token_ids[part.token]
+            except KeyError:
+                token_id = len(tokens)
+                token_ids[part.token] = token_id
+                tokens.append(_token_to_str(part.token))
+
+            parts.append([token_id, part.text])
+
+        output.append([line.has_newline, parts])
+
+    return {"tokens": tokens, "lines": output}
+
+
+def load_lines(data, lexer_spec):
+    """Inverse of :func:`dump_lines`, returns a list of
+    :class:`~purdy.parser.CodeLine` objects.
+
+    :param data: structure previously created by :func:`dump_lines`
+    :param lexer_spec: :class:`~purdy.parser.LexerSpec` to associate with the
+        resulting lines
+    """
+    tokens = [string_to_tokentype(name) for name in data["tokens"]]
+    lines = []
+    for has_newline, parts in data["lines"]:
+        parts = PartsList([CodePart(tokens[token_id], text) for token_id, text
+            in parts])
+        lines.append(CodeLine(lexer_spec, parts, has_newline))
+
+    return lines
+
+# =============================================================================
+# Parse Cache
+# =============================================================================
+
+class ParseCache:
+    """Stores the results of parsing in a local directory so that the same
+    content is only lexed once. Entries are keyed on a hash of the content,
+    the :class:`~purdy.parser.LexerSpec`, the installed Pygments and purdy
+    versions and the cache format, so parser changes don't re-use stale
+    entries.
+    When the directory grows beyond `max_size` bytes the least recently used
+    entries are removed.
+
+    The `hits` and `misses` attributes count the cache's lookups.
+
+    .. code-block:: python
+
+        cache = ParseCache(".purdy_cache")
+        code = Code("example.py", cache=cache)
+
+    :param directory: name of the directory, or a `pathlib.Path`, to store
+        entries in. Created if it does not exist.
+    :param max_size: maximum number of bytes to store before evicting entries.
+        Defaults to 50MB
+    """
+    def __init__(self, directory, max_size=50 * 1024 * 1024):
+        self.path = Path(directory)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.max_size = max_size
+
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def spec_name(cls, lexer_spec):
+        """Returns a string that uniquely identifies the given
+        :class:`~purdy.parser.LexerSpec`"""
+        return f"{lexer_spec.description}:{lexer_spec.lexer_path}"
+
+    def key(self, content, lexer_spec, coalesce=False):
+        """Returns the hash used to identify an entry in the cache. Lines
+        parsed with coalescing turned on (see :class:`~purdy.parser.Parser`)
+        are stored separately."""
+        digest = hashlib.sha256()
+        digest.update(f"{__version__}\0{CACHE_FORMAT}\0".encode())
+        digest.update(pygments.__version__.encode())
+        digest.update(b"\0")
+        digest.update(self.spec_name(lexer_spec).encode())
+        digest.update(b"\0")
+        if coalesce:
+            digest.update(b"coalesce\0")
+        digest.update(content.encode("utf-8", "surrogatepass"))
+        return digest.hexdigest()
+
+    def get(self, content, lexer_spec, coalesce=False):
+        """Returns a list of :class:`~purdy.parser.CodeLine` objects if the
+        content has been cached, or None if it hasn't."""
+        path = self.path / (self.key(content, lexer_spec, coalesce) + ".json")
+        try:
+            data = json.loads(path.read_text())
+            lines = load_lines(data, lexer_spec)
+        except (OSError, ValueError, KeyError, TypeError):
+            # Missing or unreadable entry
+            self.misses += 1
+            return None
+
+        # Touch the file so eviction knows it was recently used
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+        self.hits += 1
+        return lines
+
+    def put(self, content, lexer_spec, lines, coalesce=False):
+        """Stores the given :class:`~purdy.parser.CodeLine` objects as the
+        result of parsing `content`."""
+        path = self.path / (self.key(content, lexer_spec, coalesce) + ".json")
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+
+        tmp_path.write_text(json.dumps(dump_lines(lines),
+            separators=(",", ":")))
+        os.replace(tmp_path, path)
+
+        self._evict()
+
+    def clear(self):
+        """Removes all entries from the cache and resets the counters."""
+        for entry in self.path.glob("*.json"):
+            entry.unlink(missing_ok=True)
+
+        self.hits = 0
+        self.misses = 0
+
+    def _evict(self):
+        entries = []
+        total = 0
+        for entry in os.scandir(self.path):
+            if not entry.name.endswith(".json"):
+                continue
+
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+
+            entries.append( (stat.st_mtime, stat.st_size, entry.path) )
+            total += stat.st_size
+
+        if total <= self.max_size:
+            return
+
+        # Oldest first
+        entries.sort()
+        for _, size, path in entries:
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+
+            total -= size
+            if total <= self.max_size:
+                break
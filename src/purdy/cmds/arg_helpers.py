@@ -11,12 +11,18 @@ from purdy.themes import THEME_LIST
 # Document Factory
 # =============================================================================
 
-def document_factory(args, theme_name="default"):
+def document_factory(args, theme_name="default", parse=True):
     if args.nocolour:
         # Override theme
         theme_name = "no_colour"
 
-    code = Code(args.filename, args.lexer, theme_name)
+    if parse:
+        code = Code(args.filename, args.lexer, theme_name)
+    else:
+        # Empty Code object, caller is responsible for parsing the file
+        lexer_spec = LexerSpec.get_spec(args.lexer, hint=args.filename)
+        code = Code.text("", lexer_spec, theme_name)
+
     doc = Document(code)
 
     # Arguments are conditional on the subcommand, so not all args are
@@ -36,6 +42,22 @@ def document_factory(args, theme_name="default"):
 
     return doc
 
+
+def count_lines(filename):
+    """Returns the number of lines in the named file without decoding it. A
+    last line without a newline is counted too."""
+    count = 0
+    last = b"\n"
+    with open(filename, "rb") as handle:
+        for chunk in iter(lambda: handle.read(1024 * 1024), b""):
+            count += chunk.count(b"\n")
+            last = chunk[-1:]
+
+    if last != b"\n":
+        count += 1
+
+    return count
+
 # =============================================================================
 # Argument Builders for argparse
 # =============================================================================
@@ -1,13 +1,17 @@
 # subpurdy.py
 import argparse
+import sys
+
+from contextlib import contextmanager
 
 from argparse_formatter import FlexiFormatter
 from rich.console import Console
 
-from purdy.cmds.arg_helpers import (filename_arg, general_args, no_colour_arg,
-    doc_args, document_factory)
+from purdy.cmds.arg_helpers import (count_lines, filename_arg, general_args,
+    no_colour_arg, doc_args, document_factory)
+from purdy.renderers.ansi import ANSI_FORMATTERS, stream_ansi, to_ansi
 from purdy.renderers.html import to_html
-from purdy.renderers.rich import to_rich
+from purdy.renderers.rich import stream_rich_text, to_rich_text
 from purdy.renderers.rtf import to_rtf
 from purdy.scribe import print_code_lines
 
@@ -36,23 +40,72 @@ def tokens(args):
 
 def ansi(args):
     ### 'ansi' sub-command: prints content with ANSI colour highlighting
-    doc = document_factory(args)
-    output = to_rich(doc)
-    rprint(output)
+    if args.highlight:
+        # Highlight specifiers may need the parsed content, do it all at once
+        doc = document_factory(args)
+        if args.raw:
+            to_ansi(doc, args.depth, file=sys.stdout)
+            print()
+        else:
+            output = to_rich_text(doc)
+            rprint(output)
+
+        return
+
+    # Print each line as soon as it has been parsed
+    doc = document_factory(args, parse=False)
+    future_length = 0
+    if doc.line_numbers_enabled:
+        future_length = count_lines(args.filename)
+
+    with open(args.filename) as handle:
+        if args.raw:
+            for output in stream_ansi(doc, handle, future_length, args.depth):
+                sys.stdout.write(output)
+
+            print()
+            return
+
+        for output in stream_rich_text(doc, handle, future_length):
+            rprint(output, end="")
+
+    rprint()
+
+
+@contextmanager
+def _streamed(args, theme_name="default"):
+    ### Yields the document and the arguments for rendering the file while it
+    # is being parsed, or the parsed document if highlight specifiers need
+    # the content
+    if args.highlight:
+        yield document_factory(args, theme_name), {}
+        return
+
+    doc = document_factory(args, theme_name, parse=False)
+    kwargs = {}
+    if doc.line_numbers_enabled:
+        kwargs["future_length"] = count_lines(args.filename)
+
+    with open(args.filename) as handle:
+        kwargs["source"] = handle
+        yield doc, kwargs
 
 
 def html(args):
     ### 'html' sub-command: prints content as an HTML div
-    doc = document_factory(args)
-    output = to_html(doc, not args.fullhtml)
-    print(output)
+    with _streamed(args) as (doc, kwargs):
+        to_html(doc, not args.fullhtml, file=sys.stdout,
+            classes=args.classes, **kwargs)
+
+    print()
 
 
 def rtf(args):
     ### 'rtf' sub-command: prints content in RTF format
-    doc = document_factory(args, "rtf")
-    output = to_rtf(doc)
-    print(output)
+    with _streamed(args, "rtf") as (doc, kwargs):
+        to_rtf(doc, file=sys.stdout, **kwargs)
+
+    print()
 
 # =============================================================================
 # Main
@@ -77,6 +130,13 @@ sub.set_defaults(func=tokens)
 # --- ansi cmd
 sub = subparsers.add_parser("ansi", help=("Prints code with colourized ANSI "
     "results in your terminal"))
+sub.add_argument("--raw", help=("Write the ANSI escape sequences directly "
+    "instead of going through the Rich library. Faster for large files, and "
+    "the output is the same whether or not it goes to a terminal, useful "
+    "for piping into 'less -R'."), action="store_true")
+sub.add_argument("--depth", choices=ANSI_FORMATTERS.keys(),
+    default="truecolor", help=("Colour depth used with --raw, colours are "
+    "mapped to the closest one available. Defaults to 'truecolor'."))
 doc_args(sub)
 sub.set_defaults(func=ansi)
 
@@ -84,6 +144,9 @@ sub.set_defaults(func=ansi)
 sub = subparsers.add_parser("html", help="Prints code as HTML")
 sub.add_argument("--fullhtml", help=("By default only a div with the code is "
     "shown. This flag causes a full HTML doc."), action="store_true")
+sub.add_argument("--classes", help=("Style the code with CSS classes instead "
+    "of inline styles. Combine with --fullhtml to include the stylesheet."),
+    action="store_true")
 doc_args(sub)
 sub.set_defaults(func=html)
 
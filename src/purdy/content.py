@@ -4,16 +4,18 @@
 import ast
 import asttokens
 import math
+import os
 
-from collections import defaultdict
-from copy import deepcopy
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass, field
 from pathlib import Path
 
 from pygments.token import Punctuation, Whitespace, Text
 
-from purdy.parser import (CodeLine, CodePart, Fold, HighlightOff, HighlightOn,
-    LexerSpec, LineNumber, Parser, token_is_a)
+from purdy.parser import (CodeLine, CodePart, CompactLines, Fold, HighlightOff,
+    HighlightOn, LazyLines, LexerSpec, LineNumber, Parser, PartsList,
+    token_is_a)
 from purdy.themes import THEME_MAP, EMPTY_THEME
 
 # ===========================================================================
@@ -46,7 +48,7 @@ class StringSection(Section):
 
     def render_line(self, render_state, line, line_index):
         # Strings have no formatting, just append it
-        render_state.content += line
+        render_state.write(line)
 
 # ===========================================================================
 # PyText: Source code as text manipulation tools
@@ -185,14 +187,220 @@ class PyText:
 
 @dataclass
 class _CodeLineMetadata:
-    ### Used to track data associated with a :class:`CodeLine` within a
-    # :class:`Motif`.
+    ### Snapshot of the style data associated with a :class:`CodeLine`
+    # within a :class:`Code` object, see _CodeMetadata
     highlight: bool = False
     highlight_partial: list = field(default_factory=list)
     folded: bool = False
     hidden: bool = False
 
 
+@dataclass
+class _RenderedLine:
+    ### Cached output of rendering a line of a :class:`Code` object, see
+    # Code.render(). The line's metadata is checked against meta_key only if
+    # the metadata version has changed
+    line: CodeLine
+    line_number: int
+    meta_version: int
+    meta_key: tuple
+    output: list
+    next_line_number: int
+
+
+class _LineRanges:
+    ### Set of line indexes stored as sorted, non-overlapping, non-touching
+    # [start, stop) ranges. Lookups and range changes are done with a binary
+    # search, so a run of thousands of lines costs the same as a single one.
+    # The version goes up with every change
+    def __init__(self):
+        self.starts = []
+        self.stops = []
+        self.version = 0
+
+    def __contains__(self, index):
+        if not self.starts:
+            return False
+
+        pos = bisect_right(self.starts, index) - 1
+        return pos >= 0 and index < self.stops[pos]
+
+    def __iter__(self):
+        for start, stop in zip(self.starts, self.stops):
+            yield from range(start, stop)
+
+    def __bool__(self):
+        return bool(self.starts)
+
+    def overlaps(self, start, stop):
+        # True if any index in [start, stop) is in the set
+        if start >= stop:
+            return False
+
+        pos = bisect_right(self.stops, start)
+        return pos < len(self.starts) and self.starts[pos] < stop
+
+    def run_end(self, index):
+        # Returns the end of the range containing index, or index itself if
+        # it isn't in the set
+        pos = bisect_right(self.starts, index) - 1
+        if pos >= 0 and index < self.stops[pos]:
+            return self.stops[pos]
+
+        return index
+
+    def add(self, start, stop):
+        if start >= stop:
+            return
+
+        self.version += 1
+
+        # Absorb any ranges that overlap or touch the new one
+        low = bisect_left(self.stops, start)
+        high = bisect_right(self.starts, stop)
+        if low < high:
+            start = min(start, self.starts[low])
+            stop = max(stop, self.stops[high - 1])
+
+        self.starts[low:high] = [start]
+        self.stops[low:high] = [stop]
+
+    def remove(self, start, stop):
+        if start >= stop:
+            return
+
+        self.version += 1
+
+        # Ranges that overlap the removed one, keeping any parts outside it
+        low = bisect_right(self.stops, start)
+        high = bisect_left(self.starts, stop)
+        if low >= high:
+            return
+
+        starts = []
+        stops = []
+        if self.starts[low] < start:
+            starts.append(self.starts[low])
+            stops.append(start)
+
+        if self.stops[high - 1] > stop:
+            starts.append(stop)
+            stops.append(self.stops[high - 1])
+
+        self.starts[low:high] = starts
+        self.stops[low:high] = stops
+
+    def splice(self, index, count, shift):
+        # Removes [index, index + count) and moves everything after it by
+        # shift, following lines being replaced in the code
+        self.remove(index, index + count)
+
+        # Split any range running over the edit point so its tail can move
+        edge = index + count
+        pos = bisect_right(self.starts, edge) - 1
+        if pos >= 0 and self.starts[pos] < edge < self.stops[pos]:
+            self.starts.insert(pos + 1, edge)
+            self.stops.insert(pos, edge)
+
+        pos = bisect_left(self.starts, edge)
+        starts = self.starts[pos:]
+        stops = self.stops[pos:]
+        del self.starts[pos:]
+        del self.stops[pos:]
+
+        for start, stop in zip(starts, stops):
+            self.add(max(start + shift, index), stop + shift)
+
+    def clear(self):
+        self.version += 1
+        self.starts.clear()
+        self.stops.clear()
+
+
+class _CodeMetadata:
+    ### Style information for the lines in a :class:`Code` object. Full line
+    # highlighting, fold starts, and hidden lines are kept as ranges,
+    # partial highlights in a dict keyed on the line index. Indexing returns
+    # a _CodeLineMetadata snapshot, reading never creates an entry
+    def __init__(self):
+        self.highlight = _LineRanges()
+        self.highlight_partial = {}
+        self.folded = _LineRanges()
+        self.hidden = _LineRanges()
+        self._partial_version = 0
+
+    @property
+    def version(self):
+        # Goes up with every change, used to tell if cached renders are
+        # still valid
+        return self.highlight.version + self.folded.version + \
+            self.hidden.version + self._partial_version
+
+    def line_key(self, index):
+        # Hashable summary of the metadata for a line
+        partial = self.highlight_partial.get(index)
+        return (index in self.highlight, tuple(partial) if partial else None,
+            index in self.folded, index in self.hidden)
+
+    def add_partial(self, index, spec):
+        self._partial_version += 1
+        self.highlight_partial.setdefault(index, []).append(spec)
+
+    def remove_partial(self, index, spec):
+        partials = self.highlight_partial.get(index, [])
+        if spec not in partials:
+            raise ValueError("Can only turn off existing partials")
+
+        self._partial_version += 1
+        partials.remove(spec)
+        if not partials:
+            del self.highlight_partial[index]
+
+    def clear_highlight(self):
+        self._partial_version += 1
+        self.highlight.clear()
+        self.highlight_partial.clear()
+
+    def __getitem__(self, index):
+        return _CodeLineMetadata(
+            highlight=index in self.highlight,
+            highlight_partial=list(self.highlight_partial.get(index, [])),
+            folded=index in self.folded,
+            hidden=index in self.hidden,
+        )
+
+    def __contains__(self, index):
+        return index in self.highlight or index in self.highlight_partial \
+            or index in self.folded or index in self.hidden
+
+    def __iter__(self):
+        # Indexes of all lines with metadata, in order
+        indexes = set(self.highlight)
+        indexes.update(self.highlight_partial)
+        indexes.update(self.folded)
+        indexes.update(self.hidden)
+        return iter(sorted(indexes))
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def splice(self, index, count, shift):
+        # Drops the metadata for lines [index, index + count), moving that of
+        # the lines after them by shift
+        self.highlight.splice(index, count, shift)
+        self.folded.splice(index, count, shift)
+        self.hidden.splice(index, count, shift)
+
+        self._partial_version += 1
+        partial = self.highlight_partial
+        self.highlight_partial = {}
+        for num, value in partial.items():
+            if num < index:
+                self.highlight_partial[num] = value
+            elif num >= index + count:
+                self.highlight_partial[num + shift] = value
+
+
 class Code(Section):
     """Encapsulates :class:`~purdy.parser.CodeLine` objects to track lines of
     code and any associated style information.
@@ -208,30 +416,45 @@ class Code(Section):
         the category type like code, con, etc) or a
         :class:`~purdy.themes.Theme` object.  Defaults to `None` in which case
         it uses the class attribute `default_theme_name` as the theme name.
+    :param cache: Optional :class:`~purdy.cache.ParseCache` used to skip
+        re-parsing content that has been seen before. Defaults to `None` in
+        which case the class attribute `parse_cache` is used, which is also
+        `None` unless you set it.
+    :param lazy: When True, the file is memory-mapped and only parsed a
+        region at a time as lines are accessed, see
+        :class:`~purdy.parser.LazyLines`. Useful for very large files. The
+        cache is not used in lazy mode. Defaults to False.
     """
     default_theme_name = "default"
+    parse_cache = None
 
-    def __init__(self, filename, lexer="detect", theme=None):
+    def __init__(self, filename, lexer="detect", theme=None, cache=None,
+            lazy=False):
         # !!! If any defaults in here change make sure to update the .text()
         # factory
         lexer_spec = LexerSpec.get_spec(lexer, hint=filename)
         self._pre_parse_init(theme, lexer_spec)
 
         path = Path(filename).resolve()
-        self.parser = Parser(lexer_spec)
-        self.parser.parse(path.read_text(), self)
+        self.parser = Parser(lexer_spec, self._get_cache(cache))
+        if lazy:
+            self.lines = LazyLines(self.parser, path)
+        else:
+            self.parser.parse(path.read_text(), self)
 
         # !!! Anything added under here has to be copied to the text factory
         # and the spawn methods!!!
 
     @classmethod
-    def text(cls, text, lexer="py", theme=None):
+    def text(cls, text, lexer="py", theme=None, cache=None):
         """Factory method for reading code from a string instead of a file.
 
         :param text: Text to parse
         :param lexer: Identifier that determines which
             :class:`~purdy.parser.LexerSpec` to use when parsing the code.
             Defaults to "detect"
+        :param cache: Optional :class:`~purdy.cache.ParseCache`, see
+            :class:`Code` for details
         """
         # A bit tricky: construct the object without invoking __init__
         obj = Code.__new__(Code)
@@ -239,19 +462,100 @@ class Code(Section):
         lexer_spec = LexerSpec.get_spec(lexer)
         obj._pre_parse_init(theme, lexer_spec)
 
-        obj.parser = Parser(lexer_spec)
+        obj.parser = Parser(lexer_spec, obj._get_cache(cache))
         obj.parser.parse(text, obj)
 
         # !!! Anything added under here has to match __init__ and spawn!
         return obj
 
+    @classmethod
+    def load_many(cls, filenames, lexer="detect", theme=None, jobs=None,
+            compact=False, cache=None):
+        """Factory method that reads and parses many files, spreading the
+        work across a pool of processes. Parsed results are sent back from
+        the workers as :class:`~purdy.parser.CompactLines` objects.
+
+        :param filenames: iterable of file names or `pathlib.Path` objects
+        :param lexer: Identifier that determines which
+            :class:`~purdy.parser.LexerSpec` to use when parsing the code,
+            used for every file. Defaults to "detect"
+        :param theme: Theme name or object, see :class:`Code`
+        :param jobs: number of worker processes. Defaults to `None`, meaning
+            one per CPU. A value of 1 parses in this process.
+        :param compact: When True the resulting objects keep the
+            :class:`~purdy.parser.CompactLines` storage, see
+            :func:`Code.compact`. Defaults to False.
+        :param cache: Optional :class:`~purdy.cache.ParseCache`, see
+            :class:`Code` for details. Files found in the cache aren't sent
+            to the workers, and the workers' results are stored in it.
+
+        :returns: list of :class:`Code` objects in the same order as
+            `filenames`
+        """
+        filenames = [Path(filename).resolve() for filename in filenames]
+        if jobs is None:
+            jobs = os.cpu_count() or 1
+
+        if cache is None:
+            cache = cls.parse_cache
+
+        # Look up the cache here so its counters stay accurate, only the
+        # misses get parsed by the workers
+        results = [None] * len(filenames)
+        contents = {}
+        if cache is not None:
+            for index, filename in enumerate(filenames):
+                lexer_spec = LexerSpec.get_spec(lexer, hint=str(filename))
+                content = filename.read_text()
+                lines = cache.get(content, lexer_spec, Parser.coalesce)
+                if lines is None:
+                    contents[index] = (content, lexer_spec)
+                else:
+                    results[index] = CompactLines(lexer_spec, lines)
+
+        missing = [index for index, lines in enumerate(results)
+            if lines is None]
+        names = [filenames[index] for index in missing]
+        lexers = [lexer] * len(names)
+        coalesce = [Parser.coalesce] * len(names)
+        if jobs == 1 or len(names) < 2:
+            parsed = map(_load_compact, names, lexers, coalesce)
+        else:
+            chunksize = max(1, len(names) // (jobs * 4))
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                parsed = list(executor.map(_load_compact, names, lexers,
+                    coalesce, chunksize=chunksize))
+
+        for index, lines in zip(missing, parsed):
+            results[index] = lines
+            if cache is not None:
+                content, lexer_spec = contents[index]
+                cache.put(content, lexer_spec, lines, Parser.coalesce)
+
+        output = []
+        for lines in results:
+            obj = Code.__new__(Code)
+            obj._pre_parse_init(theme, lines.lexer_spec)
+            obj.parser = Parser(lines.lexer_spec, obj._get_cache(cache))
+
+            if compact:
+                obj.lines = lines
+            else:
+                obj.lines = list(lines)
+
+            output.append(obj)
+
+        return output
+
     def _pre_parse_init(self, theme, lexer_spec):
         ### Since the `.text` method does tricky stuff with `__new__`, common
         # initialization is done in this method
         self.lines = []
         self.current = 0
 
-        self.meta = defaultdict(_CodeLineMetadata)
+        self.meta = _CodeMetadata()
+        self._lines_version = 0
+        self._render_cache = None
 
         if theme is None:
             theme = self.default_theme_name
@@ -261,17 +565,30 @@ class Code(Section):
         else:
             self.theme = theme
 
+    def _get_cache(self, cache):
+        if cache is None:
+            return self.parse_cache
+
+        return cache
+
     def reset_metadata(self):
         """Sets all the style metadata back to defaults. Mostly used for
         testing.
         """
-        self.meta = defaultdict(_CodeLineMetadata)
+        self.meta = _CodeMetadata()
 
     # --- Accessors
     def __getitem__(self, index):
         """Returns a new :class:`Code` object containing the subset of
         :class:`~purdy.parser.CodeLine` objects indicated by `index`
 
+        The result has its own list of lines, but the
+        :class:`~purdy.parser.CodeLine` objects in it are shared with this
+        object rather than copied, making slices cheap to create. Lines are
+        treated as read-only: changing the result through
+        :func:`Code.replace_lines` and its relatives creates new line objects
+        and leaves this object untouched.
+
         :param index: an integer or a slice
 
         :returns: A copy of this :class:`Code` object but containing only a
@@ -279,9 +596,9 @@ class Code(Section):
         """
         code = self.spawn()
         if isinstance(index, slice):
-            code.lines = deepcopy(self.lines[index.start:index.stop])
+            code.lines = list(self.lines[index.start:index.stop])
         else:
-            code.lines = [deepcopy(self.lines[index])]
+            code.lines = [self.lines[index]]
 
         return code
 
@@ -292,7 +609,9 @@ class Code(Section):
         obj.lines = []
         obj.parser = self.parser
         obj.current = 0
-        obj.meta = defaultdict(_CodeLineMetadata)
+        obj.meta = _CodeMetadata()
+        obj._lines_version = 0
+        obj._render_cache = None
         obj.theme = self.theme
 
         return obj
@@ -323,6 +642,177 @@ class Code(Section):
         self.current = len(self.lines)
         return code
 
+    def compact(self):
+        """Converts the lines in this object into a
+        :class:`~purdy.parser.CompactLines` container, significantly reducing
+        the memory used by large files. The `.lines` attribute keeps working
+        as before except the :class:`~purdy.parser.CodeLine` objects it
+        returns are created on access and are effectively read-only.
+
+        :returns: this :class:`Code` object so calls can be chained
+        """
+        if not isinstance(self.lines, CompactLines):
+            self.lines = CompactLines(self.parser.lexer_spec, self.lines)
+
+        return self
+
+    # === Edit Methods
+    def replace_lines(self, index, count, text):
+        """Replaces one or more lines with new content. Only the changed
+        region is re-parsed: lexing restarts at the closest safe line before
+        the change (see :func:`~purdy.parser.Parser.is_restart_point`) and
+        stops as soon as the results match the existing lines again. Lines
+        outside of that region are kept as is, and any style metadata after
+        the change moves along with its line. Lexers that can't be restarted
+        (see :attr:`~purdy.parser.Parser.restartable`) re-parse everything.
+
+        If the code was stored as :class:`~purdy.parser.CompactLines` or
+        :class:`~purdy.parser.LazyLines` it is converted to a list.
+
+        .. code-block:: python
+
+            code.replace_lines(3, 1, "x = 2\n")   # change the fourth line
+            code.replace_lines(3, 2, "")          # delete two lines
+
+        :param index: index of the first line to replace, supports negative
+            indexing
+        :param count: number of lines to replace, 0 inserts the text before
+            `index`
+        :param text: string with the replacement code. If there are lines
+            after the replaced ones, a missing trailing newline is added
+        """
+        if index < 0:
+            index = len(self.lines) + index
+
+        if index < 0 or count < 0 or index + count > len(self.lines):
+            raise IndexError("Line range is out of bounds")
+
+        if not text and not count:
+            return
+
+        if not isinstance(self.lines, list):
+            self.lines = list(self.lines)
+
+        lines = self.lines
+        resume = index + count
+        if text and not text.endswith("\n") and resume < len(lines):
+            text += "\n"
+
+        # Find a line where the lexer can safely start over, the line before
+        # the change is always included as the end of the content can change
+        # how it is parsed
+        parser = self.parser
+        restartable = parser.can_restart(lines, text)
+        start = min(index - 1, len(lines) - 1)
+        if not restartable:
+            start = 0
+
+        while start > 0 and not parser.is_restart_point(lines[start],
+                lines[start - 1]):
+            start -= 1
+        start = max(start, 0)
+
+        prefix = "".join(_line_source(lines[num], True) for num in
+            range(start, index))
+        new_count = index - start + text.count("\n")
+
+        # A blank last line is dropped when the parse ends right after it,
+        # the same way Parser.parse() drops the one Pygments adds. The
+        # parse has to reach the end for the result to match a full one
+        last = lines[-1].parts if lines else None
+        to_end = not restartable or (last is not None and len(last) == 1
+            and last[0].text == "")
+
+        # Parse the changed region along with an increasing number of the
+        # following lines until the results synchronize with the old ones
+        if to_end:
+            window = len(lines)
+        else:
+            window = 32
+        while True:
+            stop = min(len(lines), resume + window)
+            content = prefix + text + "".join(_line_source(lines[num]) for num
+                in range(resume, stop))
+
+            parsed = list(parser.iter_lines(content))
+
+            # Last line of a window can't be trusted, it may be affected by
+            # what follows it
+            if to_end:
+                candidates = 0
+            elif stop == len(lines):
+                candidates = stop - resume
+            else:
+                candidates = stop - resume - 1
+
+            for offset in range(candidates):
+                position = new_count + offset
+                if position >= len(parsed):
+                    break
+
+                # Both the old and the new version of the line have to be
+                # somewhere the lexer starts over
+                num = resume + offset
+                old_line = lines[num]
+                old_previous = lines[num - 1] if num else None
+                if position:
+                    previous = parsed[position - 1]
+                else:
+                    previous = lines[start - 1] if start else None
+
+                if old_line == parsed[position] \
+                        and parser.is_restart_point(old_line, old_previous) \
+                        and parser.is_restart_point(old_line, previous):
+                    self._splice_lines(start, index, count, num,
+                        parsed[:position])
+                    return
+
+            if stop == len(lines):
+                self._splice_lines(start, index, count, stop, parsed)
+                return
+
+            window *= 2
+
+    def insert_lines(self, index, text):
+        """Inserts new lines of code before the given index, see
+        :func:`Code.replace_lines`.
+
+        :param index: index of the line to insert before, `len(code.lines)`
+            appends. Supports negative indexing.
+        :param text: string with the code to insert
+        """
+        if index < 0:
+            index = len(self.lines) + index
+
+        self.replace_lines(index, 0, text)
+
+    def append_text(self, text):
+        """Appends text to the end of the code, as if it were added to the
+        end of the original content. If the last line has no newline the
+        text continues it. See :func:`Code.replace_lines`.
+
+        :param text: string with the code to append
+        """
+        if self.lines and not self.lines[-1].has_newline:
+            last = len(self.lines) - 1
+            self.replace_lines(last, 1, _line_source(self.lines[last]) + text)
+        else:
+            self.replace_lines(len(self.lines), 0, text)
+
+    def _splice_lines(self, start, index, count, stop, parsed):
+        # Puts the newly parsed lines into the place of lines[start:stop],
+        # keeping the old objects for any unchanged lines before the edit
+        for num in range(start, min(index, start + len(parsed))):
+            if self.lines[num] == parsed[num - start]:
+                parsed[num - start] = self.lines[num]
+
+        shift = (len(parsed) - (stop - start))
+        self.lines[start:stop] = parsed
+        self._lines_version += 1
+
+        # Move the metadata with its line
+        self.meta.splice(index, count, shift)
+
     # === Style Methods
 
     # --- Fold Management
@@ -333,29 +823,25 @@ class Code(Section):
         :param length: how many lines to include in the fold
         """
         # Nested folding is not supported, check for overlaps and error out
-        for i in range(index, index + length):
-            if i in self.meta and (self.meta[i].folded or self.meta[i].hidden):
-                raise ValueError("Nested folding is not allowed")
+        stop = index + length
+        if self.meta.folded.overlaps(index, stop) or \
+                self.meta.hidden.overlaps(index, stop):
+            raise ValueError("Nested folding is not allowed")
 
         # Fold the line
-        self.meta[index].folded = True
-        for i in range(index + 1, index + length):
-            self.meta[i].hidden = True
+        self.meta.folded.add(index, index + 1)
+        self.meta.hidden.add(index + 1, stop)
 
     def unfold(self, index):
         """Removes a previously created fold that starts on the given index
         line."""
-        if index not in self.meta or (not self.meta[index].folded):
+        if index not in self.meta.folded:
             raise ValueError(f"Line {index} was not the beginning of a fold")
 
-        self.meta[index].folded = False
-
-        # Loop through everything past the fold and unhide if hidden
-        for i in range(index + 1, len(self.lines)):
-            if i not in self.meta or not self.meta[i].hidden:
-                break
+        self.meta.folded.remove(index, index + 1)
 
-            self.meta[i].hidden = False
+        # Unhide the run of hidden lines after the fold
+        self.meta.hidden.remove(index + 1, self.meta.hidden.run_end(index + 1))
 
     # --- Highlight Setters
     def _set_highlight(self, indicator, value):
@@ -365,31 +851,33 @@ class Code(Section):
                 if index < 0:
                     index = len(self.lines) + index
 
-                self.meta[index].highlight = value
+                start, stop = index, index + 1
             case (start, length):
                 # Tuple, highlight start and length following lines
                 if start < 0:
                     start = len(self.lines) + start
 
-                for index in range(start, start + length):
-                    self.meta[index].highlight = value
+                stop = start + length
             case str(indicator):
                 # String can be an integer, or a range
                 indicator = indicator.strip()
                 if indicator.startswith("-"):
                     # Negative Number
-                    index = len(self.lines) + int(indicator)
-
-                    self.meta[index].highlight = value
+                    start = len(self.lines) + int(indicator)
+                    stop = start + 1
                 elif "-" in indicator:
                     # Range
                     start, stop = indicator.split("-")
-
-                    for index in range(int(start), int(stop) + 1):
-                        self.meta[index].highlight = value
+                    start, stop = int(start), int(stop) + 1
                 else:
                     # Positive number
-                    self.meta[int(indicator)].highlight = value
+                    start = int(indicator)
+                    stop = start + 1
+
+        if value:
+            self.meta.highlight.add(start, stop)
+        else:
+            self.meta.highlight.remove(start, stop)
 
     def _parse_partial_arg_num(self, line, arg_wanted):
         # Loop to find the opening bracket
@@ -503,7 +991,7 @@ class Code(Section):
             if isinstance(arg, str) and ":" in arg:
                 index, spec = self._parse_partial(arg)
 
-                self.meta[index].highlight_partial.append(spec)
+                self.meta.add_partial(index, spec)
                 continue
 
             # Argument is for a full line add it to the highlighting set
@@ -516,12 +1004,8 @@ class Code(Section):
         for arg in args:
             if isinstance(arg, str) and ":" in arg:
                 index, spec = self._parse_partial(arg)
-                if index in self.meta:
-                    # Only turn it off it was already on
-                    try:
-                        self.meta[index].highlight_partial.remove(spec)
-                    except ValueError:
-                        raise ValueError("Can only turn off existing partials")
+                # Only turn it off it was already on
+                self.meta.remove_partial(index, spec)
 
                 continue
 
@@ -530,29 +1014,112 @@ class Code(Section):
 
     def highlight_all_off(self):
         """Removes all highlighting"""
-        for value in self.meta.values():
-            value.highlight = False
-            value.highlight_partial = []
+        self.meta.clear_highlight()
 
     def is_highlighted(self, line_index):
-        if line_index not in self.meta:
-            return False
-
-        meta_info = self.meta[line_index]
-        return meta_info.highlight or meta_info.highlight_partial
+        return line_index in self.meta.highlight or \
+            line_index in self.meta.highlight_partial
 
     # === Rendering
+    def render(self, render_state):
+        """Renders all the lines into the :class:`RenderState` object. If the
+        formatter's `cache_lines` attribute is True, the output of each line
+        is kept and re-used by the next render of this object, as long as the
+        line's content, its metadata, its line number, and the render
+        settings haven't changed. Only the lines that did change get rendered again.
+        """
+        formatter = render_state.formatter
+        if not getattr(formatter, "cache_lines", False):
+            super().render(render_state)
+            return
+
+        doc = render_state.doc
+        key = (type(formatter), self.theme, dict(formatter.exceptions),
+            doc.wrap, doc.fold_char,
+            getattr(render_state, "line_number_width", None))
+
+        if self._render_cache is None or self._render_cache[0] != key:
+            self._render_cache = (key, self.meta, None, None, [])
+
+        _, meta, lines, lines_version, cached = self._render_cache
+        version = self.meta.version if self.meta is meta else None
+
+        # Compact and lazy storage are read-only and build new line objects on
+        # every access, if they haven't been replaced since the last render
+        # the content is known to be the same. Otherwise lines that aren't the
+        # same object are compared, a list can be changed directly
+        unedited = lines is self.lines and \
+            lines_version == self._lines_version and \
+            isinstance(self.lines, (CompactLines, LazyLines))
+
+        entries = []
+        for line_index, line in enumerate(self.lines):
+            entry = None
+            if line_index < len(cached):
+                entry = cached[line_index]
+                if entry.line_number != render_state.line_number:
+                    entry = None
+                elif entry.line is not line and not unedited and \
+                        entry.line != line:
+                    entry = None
+                elif entry.meta_version != version:
+                    if entry.meta_key == self.meta.line_key(line_index):
+                        entry.meta_version = version
+                    else:
+                        entry = None
+
+            if entry is None:
+                entry = self._render_to_cache(render_state, line, line_index,
+                    version)
+            else:
+                for chunk in entry.output:
+                    render_state.write(chunk)
+
+                render_state.line_number = entry.next_line_number
+
+            entries.append(entry)
+
+        self._render_cache = (key, self.meta, self.lines, self._lines_version,
+            entries)
+
+    def render_source(self, render_state, source):
+        """Parses `source` and renders each line as soon as it has been
+        parsed, as if it were in this object. The lines aren't kept, so
+        memory use doesn't grow with the size of the source.
+
+        .. warning:: highlighting and folding can only be applied to lines by
+            their index, specifiers that need the parsed content (negative
+            indexes, arguments) won't work
+
+        :param render_state: :class:`RenderState` to render into
+        :param source: string, file-like object or iterable of strings to
+            parse, see :func:`~purdy.parser.Parser.iter_lines`
+        """
+        for line_index, line in enumerate(self.parser.iter_lines(source)):
+            self.render_line(render_state, line, line_index)
+
+    def _render_to_cache(self, render_state, line, line_index, version):
+        # Renders a line on its own, appending it to the render_state, and
+        # returns a cache entry for it
+        line_number = render_state.line_number
+        saved = render_state.begin_capture()
+        self.render_line(render_state, line, line_index)
+        output = render_state.end_capture(saved)
+
+        return _RenderedLine(line, line_number, version,
+            self.meta.line_key(line_index), output, render_state.line_number)
+
     def render_line(self, render_state, line, line_index):
         """Responsible for rendering the given line and appending the result
         into the :class:`RenderState` object.
         """
-        if line_index in self.meta and self.meta[line_index].hidden:
+        if line_index in self.meta.hidden:
             # No change to render_state, but may need to advance line count
             if render_state.doc.line_numbers_enabled:
                 render_state.line_number += 1
             return
 
-        if line_index in self.meta and self.meta[line_index].folded:
+        if line_index in self.meta.folded:
             # This is the parent line in a fold, display an indicator
             # instead
             output = CodeLine(lexer_spec=line.lexer_spec, has_newline=True)
@@ -566,78 +1133,102 @@ class Code(Section):
             return
 
         # Handle the actual line, adding line numbers, dealing with
-        # highlighting and wrapping it if needed
+        # highlighting and wrapping it if needed. Lines are shared and
+        # read-only, so any additions go in a new line that re-uses the
+        # original's parts
         if self.is_highlighted(line_index):
-            line = self._apply_highlight(line_index)
+            line = self._apply_highlight(line_index, line)
 
-        output = deepcopy(line)
         if render_state.doc.line_numbers_enabled:
-            part = render_state.next_line_number_part()
-            output.parts.insert(0, part)
+            parts = PartsList([render_state.next_line_number_part()])
+            parts.extend(line.parts)
+            line = CodeLine(line.lexer_spec, parts, line.has_newline)
 
-        lwr = _LineWrapRenderer(render_state, output)
+        lwr = _LineWrapRenderer(render_state, line)
         lwr.run()
 
     # --- Highlighting Application
     @classmethod
-    def _expand_parts(cls, line):
-        """Creates a new list of parts expanding the text of each part into
-        its own :class:`~purdy.parser.CodePart`, essentially creating parts
-        consisting of a single letter.
+    def _highlight_ranges(cls, cutpoints):
+        """Turns (start, length) cut points into a sorted list of (start,
+        end) ranges, merging any that overlap. Ranges that only touch are
+        kept separate.
 
-        :param line: :class:`~purdy.parser.CodeLine` to expand
-        :returns: list of :class:`~purdy.parser.CodePart` objects
+        :param cutpoints: iterable of (start, length) cut point tuples
         """
-        char_parts = []
-        for part in line.parts:
-            if len(part.text) == 0:
-                char_parts.append(deepcopy(part))
+        ranges = []
+        for start, length in sorted(cutpoints):
+            if length <= 0:
                 continue
 
-            for char in part.text:
-                char_parts.append(CodePart(part.token, char))
+            end = start + length
+            if ranges and start < ranges[-1][1]:
+                ranges[-1][1] = max(ranges[-1][1], end)
+            else:
+                ranges.append([start, end])
 
-        return char_parts
+        return ranges
 
     @classmethod
     def _chop_partial_highlight(cls, line, cutpoints):
         """Creates a new :class:`~purdy.parser.CodeLine` with highlight tokens
-        at partial highlight spots
+        at partial highlight spots. Only the parts that a range starts or
+        ends inside of are split, everything else is re-used as is.
 
-        :param line: :class:`~purdy.parser.CodeLine` to copy and transform
+        :param line: :class:`~purdy.parser.CodeLine` to transform, it is
+            not modified
         :param cutpoints: iterable of (start, length) cut point tuples
         """
-        cutpoints.sort()
-        char_parts = cls._expand_parts(line)
+        # Flatten the ranges into a sorted list of positions at which to
+        # insert a highlight token
+        events = []
+        for start, end in cls._highlight_ranges(cutpoints):
+            events.append( (start, HighlightOn) )
+            events.append( (end, HighlightOff) )
 
-        # Create slices based on the cutpoints
-        slices = []
-        for cutpoint in cutpoints:
-            slices.append( (cutpoint[0], cutpoint[0] + cutpoint[1]) )
-
-        # Iterate through each part, checking if it is inside a slice
         output = CodeLine(line.lexer_spec, has_newline=line.has_newline)
-        slice_iter = iter(slices)
-        sliced = next(slice_iter)
+        num = 0
+        pos = 0
+        is_on = False
+        for part in line.parts:
+            end = pos + len(part.text)
+            if num == len(events) or events[num][0] >= end and \
+                    events[num][0] != pos:
+                # Nothing happens inside this part
+                output.parts.append(part)
+                pos = end
+                continue
+
+            cut = 0
+            while num < len(events) and (events[num][0] < end or
+                    events[num][0] == pos):
+                at, token = events[num]
+                if at - pos > cut:
+                    output.parts.append(CodePart(part.token,
+                        part.text[cut:at - pos]))
+                    cut = at - pos
 
-        for num in range(0, len(char_parts)):
-            if sliced and num == sliced[0]:
-                output.parts.append(CodePart(HighlightOn, ""))
+                output.parts.append(CodePart(token, ""))
+                is_on = token is HighlightOn
+                num += 1
 
-            output.parts.append(char_parts[num])
+            if cut == 0:
+                output.parts.append(part)
+            elif cut < len(part.text):
+                output.parts.append(CodePart(part.token, part.text[cut:]))
 
-            if sliced and num == sliced[1] - 1:
-                output.parts.append(CodePart(HighlightOff, ""))
-                try:
-                    sliced = next(slice_iter)
-                except StopIteration:
-                    sliced = None
+            pos = end
 
-        # Recompress our output
+        if is_on:
+            # Range goes past the end of the line
+            output.parts.append(CodePart(HighlightOff, ""))
+
+        # Merge neighbouring parts with the same token, keeping the results
+        # the same as they were when highlighting split every character
         output.compress()
         return output
 
-    def _apply_highlight(self, line_index):
+    def _apply_highlight(self, line_index, line=None):
         """If there is highlighting to apply, creates a new
         :class:`~purdy.parser.CodeLine` as a copy of the given one but with
         highlight tokens applied. If there is no highlighting, just returns
@@ -645,26 +1236,43 @@ class Code(Section):
 
         :param line_index: Index value of :class:`~purdy.parser.CodeLine`
             inside this `Code` object
+        :param line: the line at `line_index`, for lines that aren't stored
+            in this object. Defaults to `self.lines[line_index]`
         """
-        if line_index not in self.meta:
-            # No highlighting (this is checked here to remove "and" clauses
-            # from below reducing line length)
-            return self.lines[line_index]
-
-        output = deepcopy(self.lines[line_index])
-
-        if self.meta[line_index].highlight:
+        output = self.lines[line_index] if line is None else line
+        if line_index in self.meta.highlight:
             # Highlight whole line, stick tokens at beginning and end
-            output.parts.insert(0, CodePart(HighlightOn, ""))
-            output.parts.append(CodePart(HighlightOff, ""))
-        elif self.meta[line_index].highlight_partial:
+            parts = PartsList([CodePart(HighlightOn, "")])
+            parts.extend(output.parts)
+            parts.append(CodePart(HighlightOff, ""))
+            output = CodeLine(output.lexer_spec, parts, output.has_newline)
+        elif line_index in self.meta.highlight_partial:
             # Partial highlighting, insert tokens as needed inside the line
             output = self._chop_partial_highlight(output,
-                self.meta[line_index].highlight_partial)
+                self.meta.highlight_partial[line_index])
 
         # Else: no highlighting
         return output
 
+
+def _line_source(line, newline=False):
+    ### Returns the original source text of a CodeLine, optionally forcing a
+    # trailing newline
+    text = "".join(part.text for part in line.parts)
+    if newline or line.has_newline:
+        text += "\n"
+
+    return text
+
+
+def _load_compact(filename, lexer, coalesce):
+    ### Worker for Code.load_many(), module level so it can be pickled. The
+    # class level coalesce setting is passed along as worker processes may
+    # not inherit it
+    lexer_spec = LexerSpec.get_spec(lexer, hint=str(filename))
+    parser = Parser(lexer_spec, coalesce=coalesce)
+    return CompactLines(lexer_spec, parser.iter_lines(filename.read_text()))
+
 # ---------------------------------------------------------------------------
 
 class _LineWrapRenderer:
@@ -687,8 +1295,7 @@ class _LineWrapRenderer:
             self.formatter.render_code_line(self.render_state, self.line)
             return
 
-        chunkify = deepcopy(self.line)
-        self._chunk_line(chunkify)
+        self._chunk_line(self.line)
 
     def _reset_current_line(self):
         self.current = self.line.spawn()
@@ -723,8 +1330,8 @@ class _LineWrapRenderer:
         return right
 
     def _chunk_line(self, chunkify):
-        """Splits given line into chunks of rendered lines. Modifies line in
-        place, so it what is passed in should be a copy."""
+        """Splits given line into chunks of rendered lines. The line and its
+        parts are not modified, split parts are new objects."""
         self._reset_current_line()
 
         for part in chunkify.parts:
@@ -739,9 +1346,8 @@ class _LineWrapRenderer:
                         self.current.parts.append(right)
                         break
             else:
-                # Not a split point, Copy the CodePart into the wrapped line
-                full = CodePart(part.token, part.text)
-                self.current.parts.append(full)
+                # Not a split point, the CodePart goes in the wrapped line
+                self.current.parts.append(part)
 
         if len(self.current.parts) > 0:
             # Render whatever is left
@@ -778,14 +1384,24 @@ class RenderState:
     """Encapsulates the data needed for rendering and will contain the
     rendered output of of a :class:`Document`.
 
+    Formatters add their output through :func:`RenderState.write`, which
+    collects it in a list of chunks that are only joined together when the
+    `content` attribute is read. If a `file` is given the output is written
+    to it instead, in batches of `flush_size` chunks, and `content` stays
+    empty. Call :func:`RenderState.result` when rendering is done.
+
     :param document: `Document` that will be rendered
     :param future_length: When calculating width for line numbers, add this
         value to the max length. Useful when the :class:`RenderState` needs to
         be created before content gets added to the :class:`Document`.
+    :param file: Optional file-like object to stream the output to
     """
-    def __init__(self, document, future_length=0):
+    flush_size = 1024
+
+    def __init__(self, document, future_length=0, file=None):
         self.doc = document
-        self.content = ""
+        self.file = file
+        self._chunks = []
         self.line_number = None
 
         if document.line_numbers_enabled:
@@ -797,6 +1413,90 @@ class RenderState:
 
             self.line_number_width = int(math.log10(max_line) + 1)
 
+    # --- Output
+    def write(self, chunk):
+        """Adds a chunk of rendered output. Chunks are typically strings, but
+        can be anything that supports `join`, like Textual's `Content`.
+        """
+        self._chunks.append(chunk)
+        if self.file is not None and len(self._chunks) >= self.flush_size:
+            self.flush()
+
+    def flush(self):
+        """Writes any buffered output to the file, if there is one"""
+        if self.file is not None and self._chunks:
+            self.file.write("".join(self._chunks))
+            self._chunks = []
+
+    def result(self):
+        """Finishes rendering, flushing any buffered output.
+
+        :returns: the rendered content, or `None` if the output went to a
+            file
+        """
+        if self.file is not None:
+            self.flush()
+            return None
+
+        return self.content
+
+    @property
+    def content(self):
+        """Rendered output collected so far, joined into a single value.
+        Always empty when writing to a file."""
+        if self.file is not None or not self._chunks:
+            return ""
+
+        if len(self._chunks) > 1:
+            chunks = self._chunks
+            joiner = ""
+            for chunk in chunks:
+                if not isinstance(chunk, str):
+                    # Join rich text with an empty instance of its own class,
+                    # plain strings (e.g. from a StringSection) get wrapped
+                    # in it as not every class can join them
+                    cls = chunk.__class__
+                    joiner = cls()
+                    chunks = [cls(value) if isinstance(value, str) else value
+                        for value in chunks]
+                    break
+
+            self._chunks = [joiner.join(chunks)]
+
+        return self._chunks[0]
+
+    @content.setter
+    def content(self, value):
+        # Setting an empty value clears the output, so it doesn't end up
+        # being joined with chunks that aren't strings
+        self._chunks = [value] if value else []
+
+    def begin_capture(self):
+        """Starts collecting the written output on its own, separate from
+        what has been rendered so far. Used with
+        :func:`RenderState.end_capture`.
+
+        :returns: state to pass to :func:`RenderState.end_capture`
+        """
+        saved = (self.file, self._chunks)
+        self.file = None
+        self._chunks = []
+        return saved
+
+    def end_capture(self, saved):
+        """Finishes a capture started by :func:`RenderState.begin_capture`,
+        writing the captured output to the original destination.
+
+        :param saved: value returned by :func:`RenderState.begin_capture`
+        :returns: list of the chunks that were captured
+        """
+        captured = self._chunks
+        self.file, self._chunks = saved
+        for chunk in captured:
+            self.write(chunk)
+
+        return captured
+
     def next_line_number(self):
         """Gets the next line number and increments the count."""
         output = self.line_number
@@ -6,10 +6,16 @@ Additional Lexers not included in Pygments
 
 """
 import re
+import tokenize
+
+from io import StringIO
+from itertools import accumulate
 
 from pygments.lexer import Lexer
 from pygments.lexers import BashSessionLexer
-from pygments.token import Generic, Text
+from pygments.lexers.python import PythonLexer
+from pygments.token import (Comment, Generic, Keyword, Name, Number,
+    Operator, Punctuation, String, Text, Whitespace)
 
 # =============================================================================
 
@@ -30,3 +36,416 @@ class NewlineLexer(Lexer):
         for token in text.split("\n"):
             yield 0, Generic.Output, token
             yield 0, Text, "\n"
+
+
+# -----------------------------------------------------------------------------
+# Python lexer based on the standard library's tokenize module
+
+class _TokenizeFailed(Exception):
+    pass
+
+
+# Escape sequences and interpolation inside of string bodies, mirrors the
+# rules in Pygments' PythonLexer
+_BYTES_ESCAPE = r"""\\([\\abfnrtv"']|\n|x[a-fA-F0-9]{2}|[0-7]{1,3})"""
+_STR_ESCAPE = r"\\(N\{.*?\}|u[a-fA-F0-9]{4}|U[a-fA-F0-9]{8})|" + \
+    _BYTES_ESCAPE
+_RAW_ESCAPE = r"""\\[\\"'\n]"""
+_INTERPOL = (r"%(\(\w+\))?[-#0 +]*([0-9]+|[*])?(\.([0-9]+|[*]))?[hlL]?"
+    r"[E-GXc-giorsaux%]|\{((\w+)((\.\w+)|(\[[^\]]+\]))*)?(\![sra])?"
+    r"(\:(.?[<>=\^])?[-+ ]?#?0?(\d+)?,?(\.\d+)?[E-GXb-gnosx%]?)?\}")
+
+_STRING_PARTS = {
+    # (raw, bytes) -> regex
+    (False, False): re.compile(f"(?P<escape>{_STR_ESCAPE})|{_INTERPOL}"),
+    (False, True): re.compile(f"(?P<escape>{_BYTES_ESCAPE})|{_INTERPOL}"),
+    (True, False): re.compile(f"(?P<escape>{_RAW_ESCAPE})|{_INTERPOL}"),
+    (True, True): re.compile(f"(?P<escape>{_RAW_ESCAPE})|{_INTERPOL}"),
+}
+_FSTRING_PARTS = {
+    # raw -> regex
+    False: re.compile(r"\{\{|\}\}|[{}]|" + _STR_ESCAPE),
+    True: re.compile(r"\{\{|\}\}|[{}]|" + _RAW_ESCAPE),
+}
+_FSTRING_END = re.compile(r"(=\s*)?(![sraf])?[}:]")
+
+_SOFT_KEYWORD_BLOCKERS = re.compile(r"[ \t]*(?:[:,;=^&|@~)\]}]|(?:and|as|"
+    r"assert|async|await|break|class|continue|def|del|elif|else|except|"
+    r"finally|for|from|global|if|import|in|is|lambda|nonlocal|not|or|pass|"
+    r"raise|return|try|while|with|yield)\b)")
+_FLOAT_IMAGINARY = re.compile(r"\d(?:_?\d)*[eE][+-]?\d(?:_?\d)*j")
+
+_PUNCTUATION = set("[]{}:(),;")
+_FSTRING_START = getattr(tokenize, "FSTRING_START", None)
+_FSTRING_END_TOKEN = getattr(tokenize, "FSTRING_END", None)
+
+
+def _python_names():
+    # Returns a map of keyword, builtin and magic names to their token type,
+    # the word lists come from Pygments' PythonLexer so that the two lexers
+    # agree with each other
+    names = {}
+    for state in ["magicvars", "magicfuncs", "builtins", "keywords"]:
+        for rule in PythonLexer.tokens[state]:
+            words = getattr(rule[0], "words", None)
+            if words is None:
+                continue
+
+            for word in words:
+                if " " not in word:
+                    names[word] = rule[1]
+
+    for word in ["self", "cls", "Ellipsis", "NotImplemented"]:
+        names[word] = Name.Builtin.Pseudo
+
+    for word in ["in", "is", "and", "or", "not"]:
+        names[word] = Operator.Word
+
+    return names
+
+
+class TokenizePythonLexer(Lexer):
+    """Python 3 lexer built on the standard library's `tokenize` module
+    rather than regular expressions. It produces the same token types as
+    the Pygments `PythonLexer`, so themes apply unchanged, but is
+    considerably faster on large files. Content that `tokenize` rejects,
+    like an unterminated triple quoted string, is lexed by the Pygments
+    `PythonLexer` instead.
+    """
+    name = "Python (tokenize)"
+    aliases = ["pyfast"]
+
+    # Content with a syntax error is handed to Pygments as a whole, so a line
+    # can't be re-lexed without the lines that follow it
+    restartable = False
+
+    _names = None
+
+    def get_tokens_unprocessed(self, text):
+        if TokenizePythonLexer._names is None:
+            TokenizePythonLexer._names = _python_names()
+
+        try:
+            # Everything is tokenized before anything is returned so
+            # failures can be handed off to Pygments
+            tokens = list(self._tokens(text, 0))
+        except (_TokenizeFailed, tokenize.TokenError, SyntaxError):
+            yield from PythonLexer(**self.options).get_tokens_unprocessed(
+                text)
+            return
+
+        yield from tokens
+
+    def _tokens(self, source, offset):
+        # Generator yielding (index, token type, value) for the Python code
+        # in source, index values are shifted by offset
+        line_starts = [0]
+        line_starts.extend(accumulate(len(line) + 1 for line in
+            source.split("\n")))
+
+        names = self._names
+        pos = 0
+        mode = None
+        prev = ""
+        decorator = None
+        fstring_depth = 0
+        soft_underscore = None
+
+        readline = StringIO(source).readline
+        for tok_type, value, (srow, scol), (erow, ecol), _ in \
+                tokenize.generate_tokens(readline):
+            start = line_starts[srow - 1] + scol
+            end = line_starts[erow - 1] + ecol
+
+            if tok_type == _FSTRING_START:
+                # Python 3.12+ tokenizes the inside of f-strings, treat them
+                # as a single string like older versions do
+                fstring_depth += 1
+                if fstring_depth == 1:
+                    fstring_start = start
+                continue
+            elif fstring_depth:
+                if tok_type != _FSTRING_END_TOKEN:
+                    continue
+
+                fstring_depth -= 1
+                if fstring_depth:
+                    continue
+
+                tok_type = tokenize.STRING
+                start = fstring_start
+                value = source[start:end]
+            elif tok_type == tokenize.ERRORTOKEN:
+                raise _TokenizeFailed()
+            elif tok_type not in (tokenize.NAME, tokenize.NUMBER,
+                    tokenize.STRING, tokenize.OP, tokenize.COMMENT):
+                # Whitespace and structure tokens, the whitespace gets
+                # picked up between tokens
+                if tok_type == tokenize.NEWLINE:
+                    mode = None
+                    soft_underscore = None
+                continue
+
+            if decorator is not None:
+                if tok_type == tokenize.NAME and start == decorator + 1:
+                    yield offset + decorator, Name.Decorator, "@" + value
+                    pos = end
+                    decorator = None
+                    prev = value
+                    continue
+
+                # Lone "@" is matrix multiplication
+                yield offset + decorator, Operator, "@"
+                pos = decorator + 1
+                decorator = None
+
+            if start > pos:
+                gap = source[pos:start]
+                yield from self._whitespace(offset + pos, gap)
+                if mode in ("import", "from") and "\n" in gap:
+                    mode = None
+
+            pos = end
+
+            if tok_type == tokenize.NAME:
+                token = names.get(value, Name)
+                if mode == "def":
+                    if token is not Name.Function.Magic:
+                        token = Name.Function
+                    mode = None
+                elif mode == "class":
+                    token = Name.Class
+                    mode = None
+                elif mode == "import":
+                    if value == "as" and source[start - 1].isspace():
+                        token = Keyword
+                    else:
+                        token = Name.Namespace
+                elif mode == "from":
+                    if value == "import" and source[start - 1].isspace():
+                        token = Keyword.Namespace
+                        mode = None
+                    elif value == "None":
+                        token = Keyword.Constant
+                        mode = None
+                    else:
+                        token = Name.Namespace
+                elif value in ("def", "class", "import", "from"):
+                    if value == "from" and prev == "yield" and \
+                            source[start - 6:start] == "yield ":
+                        token = Keyword
+                    elif end < len(source) and source[end] in " \t\n\\":
+                        mode = value
+                        token = Keyword if value in ("def", "class") else \
+                            Keyword.Namespace
+                    else:
+                        token = Name
+                elif token in (Name.Builtin, Name.Exception,
+                        Name.Builtin.Pseudo) and source[start - 1:start] == ".":
+                    # Builtins used as attributes are just names
+                    token = Name
+                elif value in ("match", "case") and \
+                        not source[line_starts[srow - 1]:start].strip(" \t") \
+                        and not _SOFT_KEYWORD_BLOCKERS.match(source, end):
+                    token = Keyword
+
+                    # Pygments treats the first "_" of a case statement as a
+                    # keyword
+                    underscore = source.find("_", end,
+                        line_starts[srow] - 1)
+                    if underscore != -1:
+                        soft_underscore = underscore
+
+                if soft_underscore is not None and \
+                        start <= soft_underscore < end:
+                    if value.endswith("_") and soft_underscore == end - 1:
+                        if len(value) > 1:
+                            yield offset + start, token, value[:-1]
+                        yield offset + end - 1, Keyword, "_"
+                        prev = value
+                        soft_underscore = None
+                        continue
+                    soft_underscore = None
+
+                yield offset + start, token, value
+            elif tok_type == tokenize.OP:
+                if value == "@":
+                    decorator = start
+                    continue
+
+                if mode in ("import", "from") and value == ".":
+                    token = Name.Namespace
+                elif mode == "import" and value == ",":
+                    token = Operator
+                elif value in _PUNCTUATION:
+                    token = Punctuation
+                    mode = None
+                else:
+                    token = Operator
+                    mode = None
+
+                yield offset + start, token, value
+            elif tok_type == tokenize.STRING:
+                mode = None
+                yield from self._string(source, offset, start, value,
+                    line_starts[srow - 1])
+            elif tok_type == tokenize.NUMBER:
+                mode = None
+                yield from self._number(offset + start, value)
+            else:
+                # Comment
+                if start == 0 and value.startswith("#!"):
+                    yield offset + start, Comment.Hashbang, value
+                else:
+                    yield offset + start, Comment.Single, value
+
+            prev = value
+
+        if decorator is not None:
+            yield offset + decorator, Operator, "@"
+            pos = decorator + 1
+
+        if pos < len(source):
+            yield from self._whitespace(offset + pos, source[pos:])
+
+    def _whitespace(self, index, text):
+        pieces = text.split("\n")
+        for count, piece in enumerate(pieces):
+            if count:
+                yield index, Whitespace, "\n"
+                index += 1
+
+            if piece:
+                yield index, Text, piece
+                index += len(piece)
+
+    def _number(self, index, value):
+        lower = value.lower()
+        if lower.endswith("j") and not _FLOAT_IMAGINARY.fullmatch(value):
+            # Pygments doesn't treat the imaginary marker as part of the
+            # number
+            yield from self._number(index, value[:-1])
+            yield index + len(value) - 1, Name, value[-1]
+            return
+
+        if lower.startswith("0x"):
+            yield index, Number.Hex, value
+        elif lower.startswith("0o"):
+            yield index, Number.Oct, value
+        elif lower.startswith("0b"):
+            yield index, Number.Bin, value
+        elif "." in value or "e" in lower:
+            yield index, Number.Float, value
+        else:
+            yield index, Number.Integer, value
+
+    def _string(self, source, offset, start, value, line_start):
+        quote_at = 0
+        while value[quote_at] not in "'\"":
+            quote_at += 1
+
+        prefix = value[:quote_at].lower()
+        quote = value[quote_at:quote_at + 3]
+        if quote not in ('"""', "'''"):
+            quote = quote[0]
+
+        index = offset + start
+        if prefix:
+            yield index, String.Affix, value[:quote_at]
+            index += quote_at
+
+        if len(quote) == 3 and "f" not in prefix and \
+                not source[line_start:start].strip():
+            # Pygments treats any triple quoted string starting a line as a
+            # doc string
+            yield index, String.Doc, value[quote_at:]
+            return
+
+        token = String.Double if quote[0] == '"' else String.Single
+        yield index, token, quote
+        index += len(quote)
+
+        body = value[quote_at + len(quote):len(value) - len(quote)]
+        if "f" in prefix:
+            yield from self._fstring_body(index, body, token, "r" in prefix)
+        else:
+            regex = _STRING_PARTS[("r" in prefix, "b" in prefix)]
+            pos = 0
+            for match in regex.finditer(body):
+                if match.start() > pos:
+                    yield index + pos, token, body[pos:match.start()]
+
+                if match.group("escape"):
+                    yield index + match.start(), String.Escape, match.group()
+                else:
+                    yield index + match.start(), String.Interpol, \
+                        match.group()
+                pos = match.end()
+
+            if pos < len(body):
+                yield index + pos, token, body[pos:]
+
+        yield index + len(body), token, quote
+
+    def _fstring_body(self, index, body, token, raw):
+        regex = _FSTRING_PARTS[raw]
+        pos = 0
+        while True:
+            match = regex.search(body, pos)
+            if match is None:
+                break
+
+            if match.start() > pos:
+                yield index + pos, token, body[pos:match.start()]
+
+            text = match.group()
+            pos = match.end()
+            if text == "{":
+                yield index + match.start(), String.Interpol, text
+                end = self._fstring_expression_end(body, pos)
+                if end > pos:
+                    yield from self._tokens(body[pos:end], index + pos)
+
+                terminator = _FSTRING_END.match(body, end)
+                if terminator is None:
+                    raise _TokenizeFailed()
+
+                yield index + end, String.Interpol, terminator.group()
+                pos = terminator.end()
+            elif text == "}":
+                yield index + match.start(), String.Interpol, text
+            else:
+                yield index + match.start(), String.Escape, text
+
+        if pos < len(body):
+            yield index + pos, token, body[pos:]
+
+    def _fstring_expression_end(self, body, pos):
+        # Returns the position that the expression starting at pos ends at
+        depth = 0
+        while pos < len(body):
+            char = body[pos]
+            if char in "'\"":
+                close = body.find(char, pos + 1)
+                if close == -1:
+                    raise _TokenizeFailed()
+                pos = close
+            elif char in "([{":
+                depth += 1
+            elif char in ")]}":
+                if depth == 0:
+                    return pos
+                depth -= 1
+            elif depth == 0:
+                if char == ":":
+                    return pos
+                if char == "!" and body[pos + 1:pos + 2] != "=":
+                    return pos
+                if char == "=" and body[pos - 1] not in "=!<>" and \
+                        body[pos + 1:pos + 2] != "=" and \
+                        _FSTRING_END.match(body, pos):
+                    return pos
+
+            pos += 1
+
+        raise _TokenizeFailed()
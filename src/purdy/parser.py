@@ -4,18 +4,21 @@ Parser
 
 Contains methods and classes to manage parsing of code.
 """
+import mmap
+import os
+import re
+import threading
+
+from array import array
+from bisect import bisect_right
+from collections.abc import Sequence
+from contextlib import contextmanager
 from dataclasses import dataclass, field
+from importlib import import_module
 from pathlib import Path
 
-from pygments.lexer import Lexer as Pygments_Lexer
-from pygments.lexers import (BashSessionLexer, CssLexer, JsonLexer,
-    NodeConsoleLexer, PythonConsoleLexer, PythonLexer, TOMLLexer)
-from pygments.lexers.data import YamlLexer
-from pygments.lexers.markup import MarkdownLexer, RstLexer
-from pygments.lexers.templates import HtmlDjangoLexer
-from pygments.token import Generic, String, Token
-
-from purdy.lexers import DollarBashSessionLexer, NewlineLexer
+from pygments.token import (Comment, Generic, Punctuation, String, Token,
+    string_to_tokentype)
 
 # =============================================================================
 # Token Utilities
@@ -29,19 +32,60 @@ LineNumber = Token.LineNumber
 
 # -----------------------------------------------------------------------------
 
-def token_is_a(token1, token2):
-    """Returns true if token1 is the same type as or a child type of token2"""
-    if token1 == token2:
-        return True
+class _TokenRegistry:
+    ### Interns token types, giving each a small integer id and precomputing
+    # its ancestor chain so hierarchy checks don't have to walk the `.parent`
+    # links every time
+    def __init__(self):
+        self.ids = {}
+        self.tokens = []
+        self.chains = []
+        self.ancestry = {}
+
+    def intern(self, token):
+        try:
+            return self.ids[token]
+        except KeyError:
+            pass
 
-    parent = token1.parent
-    while(parent != None):
-        if parent == token2:
-            return True
+        token_id = len(self.tokens)
+
+        # Ancestor chain, starting with the token itself
+        chain = []
+        current = token
+        while current is not None:
+            chain.append(current)
+            current = current.parent
+
+        self.ids[token] = token_id
+        self.tokens.append(token)
+        self.chains.append(tuple(chain))
+        self.ancestry[token] = frozenset(chain)
+        return token_id
+
+    def chain(self, token):
+        try:
+            return self.chains[self.ids[token]]
+        except KeyError:
+            return self.chains[self.intern(token)]
 
-        parent = parent.parent
 
-    return False
+_registry = _TokenRegistry()
+
+
+def token_id(token):
+    """Returns a small integer that uniquely identifies the given token type
+    for the life of the process."""
+    return _registry.intern(token)
+
+
+def token_is_a(token1, token2):
+    """Returns true if token1 is the same type as or a child type of token2"""
+    try:
+        return token2 in _registry.ancestry[token1]
+    except KeyError:
+        _registry.intern(token1)
+        return token2 in _registry.ancestry[token1]
 
 
 def token_ancestor(token, ancestor_list):
@@ -51,19 +95,15 @@ def token_ancestor(token, ancestor_list):
     and a list of approved ancestors and attempts to make the map. If no
     ancestor is found then a generic "Token" object is returned
 
+    For repeated look-ups against a theme's tokens, use
+    :func:`~purdy.themes.Theme.ancestor` which caches the results.
+
     :param token: token to translate into an approved ancestor
     :param ancestor_list: list of approved ancestor tokens
     """
-    if token in ancestor_list:
-        return token
-
-    # token not in the approved list, search its ancestors
-    token = token.parent
-    while(token != None):
-        if token in ancestor_list:
-            return token
-
-        token = token.parent
+    for ancestor in _registry.chain(token):
+        if ancestor in ancestor_list:
+            return ancestor
 
     # something went wrong with our lookup, return the default
     return Token
@@ -73,24 +113,70 @@ def token_ancestor(token, ancestor_list):
 # Lexer Manager
 # =============================================================================
 
-@dataclass
+@dataclass(init=False)
 class LexerSpec:
     """:class:`LexerSpec` wraps a Pygments Lexer and contains data that
     changes the behaviour of the display of the code.
 
     :param description: description text about what this :class:`LexerSpec` is
         for
-    :param lexer_cls: The Pygments Lexer class used for parsing
+    :param lexer: The Pygments Lexer class used for parsing, or the dotted
+        path to it (e.g. "pygments.lexers.python.PythonLexer"). A dotted path
+        isn't imported until the lexer is first used
     :param console: True if the content is a REPL or console, False otherwise.
         This setting effects how animations and certain kinds of output are
         displayed
     :param category: Classification to use for the colourization and rendering
         map
+    :param lexer_cls: older name for the `lexer` argument, still accepted as
+        a keyword
     """
     description: str
-    lexer_cls: object
+    lexer: object
     console: bool
     category: str
+    _lexer_cls: object = field(default=None, repr=False, compare=False)
+
+    def __init__(self, description, lexer=None, console=False,
+            category="code", *, lexer_cls=None):
+        if lexer_cls is not None:
+            if lexer is not None:
+                raise TypeError("Only one of 'lexer' and 'lexer_cls' can be "
+                    "given")
+
+            lexer = lexer_cls
+
+        if lexer is None:
+            raise TypeError("LexerSpec requires a 'lexer'")
+
+        self.description = description
+        self.lexer = lexer
+        self.console = console
+        self.category = category
+        self._lexer_cls = None
+
+    @property
+    def lexer_cls(self):
+        """The Pygments Lexer class, imported on first use if the spec was
+        given a dotted path"""
+        if self._lexer_cls is None:
+            if isinstance(self.lexer, str):
+                module_name, _, cls_name = self.lexer.rpartition(".")
+                self._lexer_cls = getattr(import_module(module_name),
+                    cls_name)
+            else:
+                self._lexer_cls = self.lexer
+
+        return self._lexer_cls
+
+    @property
+    def lexer_path(self):
+        """Dotted path of the Pygments Lexer class. Doesn't cause an import
+        """
+        if isinstance(self.lexer, str):
+            return self.lexer
+
+        return f"{self.lexer.__module__}.{self.lexer.__qualname__}"
 
     @classmethod
     def get_spec(cls, lexer, hint=''):
@@ -98,11 +184,11 @@ class LexerSpec:
 
         :param lexer: An indicator as to what underlying lexer to use. It can
             be the string value "detect" to attempt to auto-detect the
-            appropriate lexer, a string corresponding to one of the built-in
-            :class:`LexerSpec` objects, a :class:`LexerSpec` itself, or a
-            `Pygments Lexer <https://pygments.org/docs/lexers/>`_ class. When
-            a Pygments Lexer is provided it is assumed to be for code and not
-            in console mode.
+            appropriate lexer, a string corresponding to one of the
+            registered :class:`LexerSpec` objects, a :class:`LexerSpec`
+            itself, or a `Pygments Lexer <https://pygments.org/docs/lexers/>`_
+            class. When a Pygments Lexer is provided it is assumed to be for
+            code and not in console mode.
         :param hint: when using lexer="detect", this provides information
             for doing the detection, like the filename
         """
@@ -116,6 +202,7 @@ class LexerSpec:
             case LexerSpec():
                 return lexer
             case _:
+                from pygments.lexer import Lexer as Pygments_Lexer
                 if not issubclass(lexer, Pygments_Lexer):
                     raise ValueError("Could not determine Parser type")
 
@@ -134,6 +221,29 @@ class LexerSpec:
             raise ValueError("Invalid LexerSpec name. Choices are:" +
                 ",".join(cls.names))
 
+    @classmethod
+    def register(cls, name, spec, aliases=()):
+        """Adds a :class:`LexerSpec` to the registry so it can be found by
+        name, e.g. by :func:`LexerSpec.get_spec` or the command line tools.
+        Registering an existing name replaces it.
+
+        .. code-block:: python
+
+            LexerSpec.register("rb", LexerSpec("Ruby",
+                "pygments.lexers.ruby.RubyLexer", False, "code"),
+                aliases=["ruby"])
+
+        :param name: name to register the spec under
+        :param spec: :class:`LexerSpec` object to register
+        :param aliases: optional sequence of alternate names for the spec
+        """
+        name = name.lower()
+        cls.built_ins[name] = spec
+        for alias in aliases:
+            cls.aliases[alias.lower()] = name
+
+        cls.names = list(cls.built_ins.keys()) + list(cls.aliases.keys())
+
     @classmethod
     def display_choices(cls):
         result = []
@@ -143,26 +253,37 @@ class LexerSpec:
         return ", ".join(result)
 
 
-#: Map of all the built-in lexers
+#: Map of all the registered lexers. Built-ins are given by dotted path so
+#: they're only imported when used, see :func:`LexerSpec.register` to add
+#: more
 LexerSpec.built_ins = {
-    'py': LexerSpec('Python 3 Source', PythonLexer, False, 'code'),
-    'repl': LexerSpec('Interactive Python 3 console', PythonConsoleLexer,
-        True, 'code'),
-    'con': LexerSpec('Interactive bash console', BashSessionLexer, True,
-        'code'),
-
-    'css': LexerSpec('CSS', CssLexer, False, 'doc'),
+    'py': LexerSpec('Python 3 Source', 'pygments.lexers.python.PythonLexer',
+        False, 'code'),
+    'pyfast': LexerSpec('Python 3 Source, faster stdlib tokenize lexer',
+        'purdy.lexers.TokenizePythonLexer', False, 'code'),
+    'repl': LexerSpec('Interactive Python 3 console',
+        'pygments.lexers.python.PythonConsoleLexer', True, 'code'),
+    'con': LexerSpec('Interactive bash console',
+        'pygments.lexers.shell.BashSessionLexer', True, 'code'),
+
+    'css': LexerSpec('CSS', 'pygments.lexers.css.CssLexer', False, 'doc'),
     'dbash': LexerSpec('Interactive bash Console with a dollar-sign prompt',
-        DollarBashSessionLexer, True, 'code'),
-    'html': LexerSpec('HTML/Django/Jinja', HtmlDjangoLexer, False, 'xml'),
-    'json': LexerSpec('JSON', JsonLexer, False, 'doc'),
-    'md': LexerSpec('Markdown Doc', MarkdownLexer, False, 'doc'),
+        'purdy.lexers.DollarBashSessionLexer', True, 'code'),
+    'html': LexerSpec('HTML/Django/Jinja',
+        'pygments.lexers.templates.HtmlDjangoLexer', False, 'xml'),
+    'json': LexerSpec('JSON', 'pygments.lexers.data.JsonLexer', False, 'doc'),
+    'md': LexerSpec('Markdown Doc', 'pygments.lexers.markup.MarkdownLexer',
+        False, 'doc'),
     'node': LexerSpec('Interactive JavaScript Node.js Console',
-        NodeConsoleLexer, True, 'code'),
-    'plain': LexerSpec('Plain text, no parsing', NewlineLexer, False, 'doc'),
-    'rst': LexerSpec('RST Doc', RstLexer, False, 'doc'),
-    'toml': LexerSpec('TOML', TOMLLexer, False, 'doc'),
-    'yaml': LexerSpec('YAML Doc', YamlLexer, False, 'doc'),
+        'pygments.lexers.javascript.NodeConsoleLexer', True, 'code'),
+    'plain': LexerSpec('Plain text, no parsing', 'purdy.lexers.NewlineLexer',
+        False, 'doc'),
+    'rst': LexerSpec('RST Doc', 'pygments.lexers.markup.RstLexer', False,
+        'doc'),
+    'toml': LexerSpec('TOML', 'pygments.lexers.configs.TOMLLexer', False,
+        'doc'),
+    'yaml': LexerSpec('YAML Doc', 'pygments.lexers.data.YamlLexer', False,
+        'doc'),
 }
 
 #: Map of aliases for lexer names
@@ -237,7 +358,12 @@ CURSOR = CodePart(token=Generic.Text, text=CURSOR_CHAR)
 
 @dataclass
 class CodeLine:
-    """Represents a line of code, made up of :class:`CodePart` objects."""
+    """Represents a line of code, made up of :class:`CodePart` objects.
+
+    Once parsed, lines are treated as read-only and may be shared between
+    :class:`~purdy.content.Code` objects, for example by slicing. Anything
+    that needs a modified line works on a new one.
+    """
     lexer_spec: LexerSpec
     parts: PartsList = field(default_factory=PartsList)
     has_newline: bool = False
@@ -287,23 +413,330 @@ class CodeLine:
 
     def compress(self):
         """Looks for sequence of parts in a row with the same token type and
-        merges them.
+        merges them. Merged parts are new objects, the originals are left
+        alone as they may be shared with other lines.
         """
         output = PartsList()
-        previous = None
         for part in self.parts:
-            if previous and output[-1].token == part.token:
-                output[-1].text += part.text
+            if output and output[-1].token == part.token:
+                output[-1] = CodePart(part.token, output[-1].text + part.text)
             else:
                 output.append(part)
-                previous = part
 
         self.parts = output
 
+
+class CompactLines(Sequence):
+    """Memory efficient, read-only storage for a list of :class:`CodeLine`
+    objects. All of the text is kept in a single string buffer and each part
+    is described by a token-type id, a start offset and a length stored in
+    `array` objects. :class:`CodeLine` objects are created on access, so
+    changing them has no effect on the stored content.
+
+    Supports the same read operations as a list: `len()`, iteration,
+    indexing, and slicing (which returns a list).
+
+    :param lexer_spec: :class:`LexerSpec` associated with the lines
+    :param lines: iterable of :class:`CodeLine` objects to store
+    """
+    def __init__(self, lexer_spec, lines=()):
+        self.lexer_spec = lexer_spec
+
+        self.tokens = []
+        self.token_ids = array("I")
+        self.starts = array("L")
+        self.lengths = array("L")
+
+        # Index into the part arrays for the first part in each line, with an
+        # extra entry on the end marking the total number of parts
+        self.line_starts = array("L", [0])
+        self.newlines = array("b")
+
+        lookup = {}
+        chunks = []
+        position = 0
+        for line in lines:
+            for part in line.parts:
+                try:
+                    token_id = lookup[part.token]
+                except KeyError:
+                    token_id = len(self.tokens)
+                    lookup[part.token] = token_id
+                    self.tokens.append(part.token)
+
+                self.token_ids.append(token_id)
+                self.starts.append(position)
+                self.lengths.append(len(part.text))
+                chunks.append(part.text)
+                position += len(part.text)
+
+            self.line_starts.append(len(self.token_ids))
+            self.newlines.append(line.has_newline)
+
+        self.text = "".join(chunks)
+
+    def _line(self, index):
+        parts = PartsList()
+        for num in range(self.line_starts[index], self.line_starts[index + 1]):
+            start = self.starts[num]
+            text = self.text[start:start + self.lengths[num]]
+            parts.append(CodePart(self.tokens[self.token_ids[num]], text))
+
+        return CodeLine(self.lexer_spec, parts, bool(self.newlines[index]))
+
+    def __len__(self):
+        return len(self.newlines)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._line(num) for num in range(*index.indices(len(self)))]
+
+        if index < 0:
+            index += len(self)
+
+        if not 0 <= index < len(self):
+            raise IndexError("CompactLines index out of range")
+
+        return self._line(index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self._line(index)
+
+    def __eq__(self, compare):
+        if not isinstance(compare, (CompactLines, LazyLines, list)):
+            return NotImplemented
+
+        return list(self) == list(compare)
+
+    def __getstate__(self):
+        # Pygments tokens drag their whole hierarchy along when pickled, send
+        # their dotted names instead
+        state = self.__dict__.copy()
+        state["tokens"] = [".".join(token) for token in self.tokens]
+        return state
+
+    def __setstate__(self, state):
+        state["tokens"] = [string_to_tokentype(name) for name in
+            state["tokens"]]
+        self.__dict__.update(state)
+
+    def __repr__(self):
+        return (f"CompactLines(lexer_spec={self.lexer_spec.lexer_cls.__name__}"
+            f", lines={len(self)}, parts={len(self.token_ids)})")
+
+
+class LazyLines(Sequence):
+    """Read-only line container that memory-maps a file and only parses it
+    a region at a time, when a line in that region is first accessed. Opening
+    is fast and memory use is proportional to the amount of content viewed.
+
+    An index of regions is built when the object is created. Each region is a
+    block of whole lines, roughly `region_size` bytes long, and is lexed on
+    its own.
+
+    .. warning:: A construct that spans a region boundary, like a very long
+        multi-line string, may be coloured differently than it would be if
+        the file was lexed all at once. Lone carriage returns are ignored.
+
+    :param parser: :class:`Parser` used to lex each region
+    :param filename: name of the file to read, or a `pathlib.Path`
+    :param encoding: encoding of the file, defaults to "utf-8"
+    :param region_size: approximate number of bytes in a region
+    """
+    def __init__(self, parser, filename, encoding="utf-8",
+            region_size=64 * 1024):
+        self.parser = parser
+        self.lexer_spec = parser.lexer_spec
+        self.encoding = encoding
+
+        with open(filename, "rb") as handle:
+            size = os.fstat(handle.fileno()).st_size
+            if size:
+                self.buffer = mmap.mmap(handle.fileno(), 0,
+                    access=mmap.ACCESS_READ)
+            else:
+                self.buffer = b""
+
+        # Byte offset and first line number of each region, each with an
+        # extra entry at the end for the totals
+        self.region_offsets = array("Q", [0])
+        self.region_lines = array("Q", [0])
+        self.regions = {}
+
+        start = 0
+        while start < size:
+            end = self._region_end(start, start + region_size, size)
+            if end == size:
+                # Last region gets parsed right away, the number of lines the
+                # lexer produces at the end of content varies
+                lines = self._parse(start, end)
+                self.regions[len(self.region_offsets) - 1] = lines
+                count = len(lines)
+            else:
+                count = self.buffer[start:end].count(b"\n")
+
+            self.region_offsets.append(end)
+            self.region_lines.append(self.region_lines[-1] + count)
+            start = end
+
+    def _region_end(self, start, end, size):
+        if end >= size:
+            return size
+
+        # Cut after a newline, avoiding cuts after a blank line as the lexer
+        # treats a trailing blank line as garbage
+        cut = self.buffer.rfind(b"\n", start, end)
+        while cut > start and self.buffer[cut - 1] == ord("\n"):
+            cut = self.buffer.rfind(b"\n", start, cut)
+
+        if cut > start:
+            return cut + 1
+
+        # No place to cut in the window, look past it
+        cut = self.buffer.find(b"\n", end)
+        while cut != -1 and self.buffer[cut - 1] == ord("\n"):
+            cut = self.buffer.find(b"\n", cut + 1)
+
+        if cut == -1:
+            return size
+
+        return cut + 1
+
+    def _parse(self, start, end):
+        text = self.buffer[start:end].decode(self.encoding)
+        text = text.replace("\r\n", "\n").replace("\r", "")
+        return list(self.parser.iter_lines(text))
+
+    def _region(self, region):
+        try:
+            return self.regions[region]
+        except KeyError:
+            pass
+
+        lines = self._parse(self.region_offsets[region],
+            self.region_offsets[region + 1])
+
+        expected = self.region_lines[region + 1] - self.region_lines[region]
+        if len(lines) != expected:
+            raise ValueError(f"Lexer produced {len(lines)} lines for a region "
+                f"containing {expected}")
+
+        self.regions[region] = lines
+        return lines
+
+    def _line(self, index):
+        region = bisect_right(self.region_lines, index) - 1
+        return self._region(region)[index - self.region_lines[region]]
+
+    def __len__(self):
+        return self.region_lines[-1]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._line(num) for num in range(*index.indices(len(self)))]
+
+        if index < 0:
+            index += len(self)
+
+        if not 0 <= index < len(self):
+            raise IndexError("LazyLines index out of range")
+
+        return self._line(index)
+
+    def __iter__(self):
+        for region in range(len(self.region_offsets) - 1):
+            yield from self._region(region)
+
+    def __eq__(self, compare):
+        if not isinstance(compare, (LazyLines, CompactLines, list)):
+            return NotImplemented
+
+        return list(self) == list(compare)
+
+    def __repr__(self):
+        return (f"LazyLines(lexer_spec={self.lexer_spec.lexer_cls.__name__}"
+            f", lines={len(self)}, parsed_regions={len(self.regions)})")
+
+# =============================================================================
+# Lexer Pool
+# =============================================================================
+
+class _LexerPool:
+    """Hands out Pygments lexer instances, re-using them between parses.
+    Some lexers (e.g. the console lexers, which build child lexers) are
+    expensive to construct, which dominates when parsing lots of small
+    snippets. A lexer is only ever used by one caller at a time, so the pool
+    is safe to share between threads.
+
+    :param max_free: maximum number of idle instances kept per lexer class
+    """
+    def __init__(self, max_free=8):
+        self.max_free = max_free
+        self.free = {}
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def lexer(self, lexer_cls):
+        """Context manager that checks out an instance of `lexer_cls` and
+        returns it to the pool when done."""
+        with self.lock:
+            try:
+                lexer = self.free[lexer_cls].pop()
+            except (KeyError, IndexError):
+                lexer = None
+
+        if lexer is None:
+            # Instantiate the lexer so that it doesn't remove starting
+            # newlines, just keeps it the way the content is.
+            #
+            # NB: it would be nice to also use "ensurenl=False" to stop the
+            # stupid appending newlines, but that breaks a whole bunch of the
+            # lexers
+            lexer = lexer_cls(stripnl=False)
+
+        try:
+            yield lexer
+        finally:
+            with self.lock:
+                free = self.free.setdefault(lexer_cls, [])
+                if len(free) < self.max_free:
+                    free.append(lexer)
+
+    def clear(self):
+        """Drops all idle lexer instances"""
+        with self.lock:
+            self.free.clear()
+
+
+lexer_pool = _LexerPool()
+
 # =============================================================================
 # Parsing
 # =============================================================================
 
+# Lexer that Parser handles without using Pygments
+_PLAIN_LEXER = "purdy.lexers.NewlineLexer"
+
+# Lines starting constructs that a lexer handles as one stream across the
+# whole content, restarting it part way through can change how they're
+# lexed. The Python console hands all of a session's tracebacks to a single
+# traceback lexer, one that isn't finished changes how the next one looks
+_SESSION_STATE = {
+    "pygments.lexers.python.PythonConsoleLexer": re.compile(
+        r'(\^C)?Traceback \(most recent call last\):|  File "[^"]+", line \d+'),
+}
+
+
+class _LineBuilder:
+    ### State of a single run of Parser._lex(): the line being built and the
+    # completed lines. Kept out of the Parser so that one Parser can be used
+    # by several threads at once
+    def __init__(self, lexer_spec):
+        self.line = CodeLine(lexer_spec)
+        self.done = []
+
+
 class Parser:
     """Parser is responsible for parsing code and returning a
     :class:`~purdy.content.Code` object containing :class:`CodeLine` objects.
@@ -311,9 +744,31 @@ class Parser:
     the :func:`LexerSpec.get_spec` method.
 
     :param lexer_spec: a :class:`LexerSpec` object
+    :param cache: optional :class:`~purdy.cache.ParseCache` object. When
+        given, previously parsed content is loaded from the cache instead of
+        being lexed again
+    :param coalesce: when True, adjacent parts with the same token type are
+        merged as they are parsed, resulting in fewer :class:`CodePart`
+        objects to render. Punctuation and prompts are never merged, nor is
+        whitespace with non-whitespace, so argument highlighting and the
+        typewriter animation see the same boundaries. Defaults to None, which
+        uses the class attribute `coalesce`, initially False
+
+    A Parser holds no state between calls, so it is safe to share between
+    threads, as :class:`~purdy.content.Code` objects created through
+    `spawn()` and slicing do.
     """
-    def __init__(self, lexer_spec):
+    coalesce = False
+
+    def __init__(self, lexer_spec, cache=None, coalesce=None):
         self.lexer_spec = lexer_spec
+        self.cache = cache
+        if coalesce is not None:
+            self.coalesce = coalesce
+
+        # Plain text doesn't need a lexer, see _lex_plain()
+        self.plain = isinstance(lexer_spec, LexerSpec) and \
+            lexer_spec.lexer_path == _PLAIN_LEXER
 
     def parse(self, content, code_obj):
         """Parses the given content using the class's associated lexer.
@@ -322,85 +777,278 @@ class Parser:
         :param code_obj: A :class:`~purdy.content.Code` object to add the
             resulting `CodeLine` objects into
         """
-        # Instantiate the lexer so that it doesn't remove starting newlines,
-        # just keeps it the way the content is.
-        #
-        # NB: it would be nice to also use "ensurenl=False" to stop the stupid
-        # appending newlines, but that breaks a whole bunch of the lexers
-        lexer = self.lexer_spec.lexer_cls(stripnl=False)
-        self.line = CodeLine(self.lexer_spec)
-        for token_type, text in lexer.get_tokens(content):
+        if self.cache is None:
+            code_obj.lines.extend(self.iter_lines(content))
+            return
+
+        lines = self.cache.get(content, self.lexer_spec, self.coalesce)
+        if lines is not None:
+            code_obj.lines.extend(lines)
+            return
+
+        start = len(code_obj.lines)
+        code_obj.lines.extend(self.iter_lines(content))
+        self.cache.put(content, self.lexer_spec, code_obj.lines[start:],
+            self.coalesce)
+
+    @property
+    def restartable(self):
+        """True if this parser's lexer can be restarted part way through
+        some content, see :func:`Parser.is_restart_point`. Lexer classes can
+        opt out by setting a `restartable` attribute to False."""
+        if self.plain:
+            return True
+
+        return self.lexer_spec.category == "code" and \
+            getattr(self.lexer_spec.lexer_cls, "restartable", True)
+
+    def can_restart(self, lines, text=""):
+        """Returns True if part of the given lines, with some of them
+        replaced by `text`, can be re-parsed on its own and give the same
+        result as parsing all of it. False if the lexer isn't
+        :attr:`Parser.restartable` or the content has something it lexes as
+        one stream across all of it, like the tracebacks in a Python
+        console session.
+
+        :param lines: list of the :class:`CodeLine` objects being edited
+        :param text: the new content being added to them
+        """
+        if not self.restartable:
+            return False
+
+        pattern = _SESSION_STATE.get(getattr(self.lexer_spec, "lexer_path",
+            None))
+        if pattern is None:
+            return True
+
+        if any(pattern.match(line) for line in text.splitlines()):
+            return False
+
+        for line in lines:
+            if line.parts and pattern.match(
+                    "".join(part.text for part in line.parts)):
+                return False
+
+        return True
+
+    def is_restart_point(self, line, previous=None):
+        """Returns True if the lexer can be safely restarted at the beginning
+        of the given, previously parsed, :class:`CodeLine`. Used to re-parse
+        part of some code after it has been edited, see
+        :func:`~purdy.content.Code.replace_lines`.
+
+        Plain text can restart anywhere, and code at a line that starts in
+        the first column with something that isn't a string or comment.
+        Console lexers handle the commands between two blocks of output
+        together, sessions restart at a prompt that follows output (which
+        also rules out continuation prompts like `...`) and doesn't continue
+        a string. Lexers for other categories carry state across lines, they
+        never restart.
+
+        :param line: :class:`CodeLine` to check
+        :param previous: the :class:`CodeLine` before it, `None` if it is the
+            first line
+        """
+        if self.plain:
+            return True
+
+        if not self.restartable or not line.parts or not line.parts[0].text:
+            return False
+
+        token = line.parts[0].token
+        if self.lexer_spec.console:
+            if not token_is_a(token, Generic.Prompt):
+                return False
+
+            if previous is not None and previous.parts and \
+                    token_is_a(previous.parts[0].token, Generic.Prompt):
+                return False
+
+            # The session's code is lexed as a whole, a string can carry on
+            # past a prompt
+            for part in line.parts[1:]:
+                if part.text and not part.text.isspace():
+                    return not token_is_a(part.token, String)
+
+            return True
+
+        if line.parts[0].text[0].isspace():
+            return False
+
+        return not (token_is_a(token, String) or token_is_a(token, Comment))
+
+    def iter_lines(self, source, batch_size=64 * 1024):
+        """Generator that parses the given source, yielding each
+        :class:`CodeLine` as soon as the lexer has finished with it. Useful
+        for rendering large content before all of it has been parsed.
+
+        .. warning:: When `source` is a file or an iterable, the content is
+            lexed in batches of whole lines. A construct that spans a batch
+            boundary, like a very long multi-line string, may be coloured
+            differently than it would be if the content were lexed all at
+            once.
+
+        :param source: a string, a file-like object with a `.read()` method,
+            or an iterable of strings that when concatenated make up the
+            content
+        :param batch_size: when `source` is a file or iterable, the
+            approximate number of characters to lex at a time
+        """
+        if isinstance(source, str):
+            yield from self._lex(source)
+            return
+
+        if hasattr(source, "read"):
+            source = iter(lambda handle=source: handle.read(batch_size), "")
+
+        buffer = ""
+        for chunk in source:
+            buffer += chunk
+            if len(buffer) < batch_size:
+                continue
+
+            # Only lex complete lines. Avoid cutting after a blank line, the
+            # lexer treats a trailing blank line as garbage
+            cut = len(buffer)
+            while True:
+                cut = buffer.rfind("\n", 0, cut)
+                if cut <= 0 or buffer[cut - 1] != "\n":
+                    break
+
+            if cut <= 0:
+                continue
+
+            yield from self._lex(buffer[:cut + 1])
+            buffer = buffer[cut + 1:]
+
+        if buffer:
+            yield from self._lex(buffer)
+
+    def _lex(self, content):
+        if self.plain:
+            yield from self._lex_plain(content)
+            return
+
+        # Completed lines are held back by two so that the garbage line
+        # clean-up below can still adjust them
+        builder = _LineBuilder(self.lexer_spec)
+        done = builder.done
+        with lexer_pool.lexer(self.lexer_spec.lexer_cls) as lexer:
+            yield from self._tokens_to_lines(lexer.get_tokens(content),
+                builder)
+
+        # Pygments adds newlines because some of the lexers need it there,
+        # get rid of it
+        last_line = done[-1]
+        if len(last_line.parts) == 1 and last_line.parts[0].text == '':
+            # Got a garbage extra line, remove it
+            del done[-1]
+
+        # Fix the last lines newline state
+        try:
+            done[-1].has_newline = content[-1] == "\n"
+        except IndexError:
+            # Empty container case can be ignored
+            pass
+
+        yield from done
+
+    def _lex_plain(self, content):
+        # Builds the same lines as running the NewlineLexer through _lex(),
+        # without Pygments: every row is a single Generic.Output part and a
+        # blank row gets an empty Text part. Mimics Pygments' clean-up of
+        # the input, and the trailing newline it adds gets dropped as it
+        # would be as a garbage line
+        text = content
+        if text.startswith("\ufeff"):
+            text = text[1:]
+
+        if "\r" in text:
+            text = text.replace("\r\n", "\n").replace("\r", "\n")
+
+        if text.endswith("\n"):
+            text = text[:-1]
+
+        lexer_spec = self.lexer_spec
+        rows = text.split("\n")
+        last = len(rows) - 1
+        for num, row in enumerate(rows):
+            if row:
+                part = CodePart(Generic.Output, row)
+            else:
+                part = CodePart(Token.Text, "")
+
+            if num == last and content:
+                has_newline = content[-1] == "\n"
+            else:
+                has_newline = True
+
+            yield CodeLine(lexer_spec, PartsList([part]), has_newline)
+
+    def _tokens_to_lines(self, tokens, builder):
+        done = builder.done
+        for token_type, text in tokens:
             if text.startswith('\n'):
-                self._newline_handler(token_type, code_obj)
+                self._newline_handler(token_type, builder)
                 if len(text) > 1:
                     # something came after the \n, handle it
                     #
                     # Example: HTML lexer isn't line oriented, so a \n
                     # followed by in indent is seeing as one chunk of text
-                    self._string_handler(token_type, text[1:], code_obj)
+                    self._string_handler(token_type, text[1:], builder)
             elif text == '':
                 # tokenizer sometimes puts in empty stuff, skip it
                 #
                 # Example: Python Console Lexer and Traceback output
                 continue
-            elif token_is_a(token_type, String) and '\n' in text:
-                self._string_handler(token_type, text, code_obj)
+            elif '\n' in text:
+                # Multi-line strings, or any token containing newlines, get
+                # split so each \n in the content is exactly one line
+                #
+                # Example: multi-line output of a bash console session
+                self._string_handler(token_type, text, builder)
             else:
-                self._default_handler(token_type, text, code_obj)
-
-        # Pygments adds newlines because some of the lexers need it there,
-        # get rid of it
-        last_line = code_obj.lines[-1]
-        if len(last_line.parts) == 1 and last_line.parts[0].text == '':
-            # Got a garbage extra line, remove it
-            del code_obj.lines[-1]
+                self._default_handler(token_type, text, builder)
 
-        # Fix the last lines newline state
-        try:
-            code_obj.lines[-1].has_newline = content[-1] == "\n"
-        except IndexError:
-            # Empty container case can be ignored
-            pass
+            if len(done) > 2:
+                yield from done[:-2]
+                del done[:-2]
 
-    def _newline_handler(self, token_type, code_obj):
+    def _newline_handler(self, token_type, builder):
         # hit a CR, time to create a new line
-        if not self.line.parts:
-            self.line = CodeLine(self.lexer_spec,
+        if not builder.line.parts:
+            builder.line = CodeLine(self.lexer_spec,
                 PartsList([CodePart(token_type, '')]))
 
-        self.line.has_newline = True
-        code_obj.lines.append(self.line)
+        builder.line.has_newline = True
+        builder.done.append(builder.line)
 
         # reset to start the next set of tokens
-        self.line = CodeLine(self.lexer_spec)
+        builder.line = CodeLine(self.lexer_spec)
 
-    def _string_handler(self, token_type, text, code_obj):
-        # String tokens may be multi-line
+    def _string_handler(self, token_type, text, builder):
+        # Tokens may be multi-line
         for row in text.splitlines(True):
-            part = CodePart(token_type, row.rstrip('\n'))
-            self.line.parts.append(part)
+            self._add_part(token_type, row.rstrip('\n'), builder)
 
             if row[-1] == '\n':
-                self.line.has_newline = True
-                code_obj.lines.append(self.line)
-                self.line = CodeLine(self.lexer_spec)
-
-    def _default_handler(self, token_type, text, code_obj):
-        if text[-1] == '\n':
-            # there is a \n at the end of the text, need to strip it out then
-            # start a newline using the same token
-            #
-            # Example: this happens with multi-line output of a bash console
-            # session
-            part = CodePart(token_type, text.rstrip('\n'))
-            self.line.parts.append(part)
-
-            # text caused a CR, create a new line object
-            self.line.has_newline = True
-            code_obj.lines.append(self.line)
-
-            # reset to start the next group of tokens
-            self.line = CodeLine(self.lexer_spec)
-        else:
-            part = CodePart(token_type, text)
-            self.line.parts.append(part)
+                builder.line.has_newline = True
+                builder.done.append(builder.line)
+                builder.line = CodeLine(self.lexer_spec)
+
+    def _default_handler(self, token_type, text, builder):
+        self._add_part(token_type, text, builder)
+
+    def _add_part(self, token_type, text, builder):
+        parts = builder.line.parts
+        if self.coalesce and parts and text:
+            last = parts[-1]
+            if last.token == token_type and last.text and \
+                    last.text.isspace() == text.isspace() and \
+                    not token_is_a(token_type, Punctuation) and \
+                    not token_is_a(token_type, Generic.Prompt):
+                last.text += text
+                parts.text_length += len(text)
+                return
+
+        parts.append(CodePart(token_type, text))
@@ -0,0 +1,219 @@
+# renderers/ansi.py
+import colorsys
+
+from pygments.token import Token, Whitespace
+
+from purdy.parser import HighlightOn, HighlightOff
+from purdy.renderers.formatter import (Formatter, TokenTags,
+    conversion_handler, stream_handler)
+
+# ===========================================================================
+
+_RESET = "\x1b[0m"
+
+# SGR parameters for the theme attributes
+_ATTRS = {
+    "bold":         "1",
+    "dim":          "2",
+    "italic":       "3",
+    "underline":    "4",
+    "reverse":      "7",
+    "strike":       "9",
+}
+
+# Levels of each channel in the 6x6x6 colour cube of 256 colour terminals
+_CUBE = (0, 95, 135, 175, 215, 255)
+
+# Standard colour indexes in hue order, starting from red
+_HUES = (1, 3, 2, 6, 4, 5)
+
+
+def _rgb(colour):
+    ### Converts a three or six digit hex colour string to an (r, g, b) tuple
+    if len(colour) == 3:
+        colour = "".join(digit * 2 for digit in colour)
+
+    return tuple(int(colour[i:i + 2], 16) for i in (0, 2, 4))
+
+
+def _distance(first, second):
+    return sum((a - b) ** 2 for a, b in zip(first, second))
+
+
+def _nearest_256(rgb):
+    ### Returns the index of the closest colour from the cube or the grey
+    # ramp of the 256 colour palette
+    levels = [min(range(6), key=lambda i: abs(_CUBE[i] - value))
+        for value in rgb]
+    cube = tuple(_CUBE[level] for level in levels)
+    cube_index = 16 + 36 * levels[0] + 6 * levels[1] + levels[2]
+
+    grey_level = min(max((sum(rgb) // 3 - 3) // 10, 0), 23)
+    grey = (8 + 10 * grey_level, ) * 3
+
+    if _distance(rgb, grey) < _distance(rgb, cube):
+        return 232 + grey_level
+
+    return cube_index
+
+
+def _nearest_16(rgb):
+    ### Returns the index of the standard colour with the closest hue, bright
+    # for light colours. Matching on distance alone would turn most pastel
+    # colours into white. Colours with little chroma map to the greys
+    hue, lightness, _ = colorsys.rgb_to_hls(*(value / 255 for value in rgb))
+    if (max(rgb) - min(rgb)) / 255 < 0.15:
+        if lightness < 0.2:
+            return 0
+
+        if lightness < 0.55:
+            return 8
+
+        return 7 if lightness < 0.9 else 15
+
+    index = _HUES[round(hue * 6) % 6]
+    return index + 8 if lightness > 0.6 else index
+
+# ===========================================================================
+
+class AnsiFormatter(Formatter):
+    ### Produces text with ANSI SGR escape sequences using 24-bit colour. The
+    # tag for each token is its list of SGR parameters, the escape
+    # sequences that start a part are built once per tag table, with and
+    # without highlighting
+    compiled_attrs = ("tag_map", "starts", "highlight_starts")
+
+    def _colour(self, colour, background):
+        r, g, b = _rgb(colour)
+        return f"{48 if background else 38};2;{r};{g};{b}"
+
+    def _create_tag_map(self):
+        super()._create_tag_map()
+
+        highlight = self.tag_map.get(HighlightOn, "")
+        starts = {}
+        highlight_starts = {}
+        for token, params in self.tag_map.items():
+            starts[token] = f"\x1b[{params}m" if params else None
+
+            if highlight and params:
+                params = f"{highlight};{params}"
+            else:
+                params = highlight or params
+
+            highlight_starts[token] = f"\x1b[{params}m" if params else None
+
+        self.starts = TokenTags(starts, self.ancestor)
+        self.highlight_starts = TokenTags(highlight_starts, self.ancestor)
+
+    def _map_tag(self, token, fg, bg, attrs, exceptions):
+        if token in exceptions:
+            self.tag_map[token] = exceptions[token]
+            return
+
+        params = [_ATTRS[attr] for attr in attrs.split() if attr in _ATTRS]
+        if fg:
+            params.append(self._colour(fg, False))
+
+        if bg:
+            params.append(self._colour(bg, True))
+
+        self.tag_map[token] = ";".join(params)
+
+    def render_code_line(self, render_state, line):
+        starts = self.starts
+        output = []
+        for part in line.parts:
+            if part.token is HighlightOn:
+                starts = self.highlight_starts
+            elif part.token is HighlightOff:
+                starts = self.starts
+
+            if not part.text:
+                continue
+
+            start = starts[part.token]
+            if start is None:
+                output.append(part.text)
+            else:
+                output.extend((start, part.text, _RESET))
+
+        if line.has_newline:
+            output.append(self.newline)
+
+        render_state.write("".join(output))
+
+
+class Ansi256Formatter(AnsiFormatter):
+    ### Maps colours to the closest entry in the 256 colour palette
+    def _colour(self, colour, background):
+        index = _nearest_256(_rgb(colour))
+        return f"{48 if background else 38};5;{index}"
+
+
+class Ansi16Formatter(AnsiFormatter):
+    ### Maps colours to the 16 standard terminal colours
+    def _colour(self, colour, background):
+        index = _nearest_16(_rgb(colour))
+        code = 30 + index if index < 8 else 90 + index - 8
+        if background:
+            code += 10
+
+        return str(code)
+
+
+ANSI_FORMATTERS = {
+    "truecolor": AnsiFormatter,
+    "256": Ansi256Formatter,
+    "16": Ansi16Formatter,
+}
+
+_CODE_TAG_EXCEPTIONS = {
+    Token:              "",
+    Whitespace:         "",
+
+    # Purdy tokens
+    HighlightOn:        _ATTRS["reverse"],
+    HighlightOff:       "",
+}
+
+# ===========================================================================
+
+def _formatter_cls(depth):
+    try:
+        return ANSI_FORMATTERS[depth]
+    except KeyError:
+        raise ValueError(f"Unknown colour depth '{depth}', must be one of "
+            + ", ".join(ANSI_FORMATTERS))
+
+
+def to_ansi(container, depth="truecolor", file=None):
+    """Transforms tokenized content in a :class:`Code` object into a string
+    with ANSI escape sequences for colouring it in a terminal. Unlike
+    :func:`~purdy.renderers.rich.to_rich` the result can be printed
+    directly, without going through the Rich library.
+
+    :param container: `Code` or :class:`Document` object to render
+    :param depth: colour depth of the terminal, one of "truecolor", "256"
+        or "16". Theme colours are mapped to the closest available colour.
+    :param file: Optional file-like object to write the output to as it is
+        rendered, instead of returning it
+    """
+    return conversion_handler(_formatter_cls(depth), container,
+        _CODE_TAG_EXCEPTIONS, file)
+
+
+def stream_ansi(container, source, future_length=0, depth="truecolor"):
+    """Generator that parses `source` as the last section of `container`
+    and yields ANSI coloured strings a line at a time. See
+    :func:`~purdy.renderers.formatter.stream_handler` for details.
+
+    :param container: `Code` or :class:`Document` object to render, last
+        section must be an empty `Code` object
+    :param source: string, file-like object or iterable of strings to parse
+    :param future_length: expected number of lines, used to size the line
+        numbers if they are turned on
+    :param depth: colour depth of the terminal, see :func:`to_ansi`
+    """
+    yield from stream_handler(_formatter_cls(depth), container, source,
+        _CODE_TAG_EXCEPTIONS, future_length)
@@ -1,10 +1,12 @@
 # renderers/formatter.py
+from functools import lru_cache
+from types import MappingProxyType
+
 from purdy.content import Code, Document, RenderState
-from purdy.parser import token_ancestor
 
 # =============================================================================
 
-def conversion_handler(formatter_cls, container, exceptions):
+def conversion_handler(formatter_cls, container, exceptions, file=None):
     """Helper function for the most common case of rendering a
     :class:`~purdy.content.Code` or :class:`~purdy.content.Document` object.
 
@@ -12,31 +14,144 @@ def conversion_handler(formatter_cls, container, exceptions):
         as the formatter for each section in the container
     :param container: :class:`~purdy.content.Code` or
         :class:`~purdy.content.Document` object to translate
+    :param file: Optional file-like object to write the output to as it is
+        rendered
+
+    :returns: rendered content, or `None` if `file` was given
     """
     if isinstance(container, Code):
         container = Document(container)
 
-    render_state = RenderState(container)
+    render_state = RenderState(container, file=file)
     for section in container:
         formatter = formatter_cls(section, exceptions)
         render_state.formatter = formatter
         section.render(render_state)
 
-    return render_state.content
+    return render_state.result()
+
+
+def stream_handler(formatter_cls, container, source, exceptions,
+        future_length=0):
+    """Generator for rendering content as it is being parsed. The last
+    section in the container must be an empty :class:`~purdy.content.Code`
+    object, lines parsed from `source` are rendered one at a time as if they
+    were in it. They aren't kept, so memory use doesn't grow with the size
+    of the source. Any sections before it are rendered first.
+
+    .. warning:: highlighting and folding can only be applied to lines by
+        their index, specifiers that need the parsed content (negative
+        indexes, arguments) won't work
+
+    :param formatter_cls: Reference to a class (not an object) to instantiate
+        as the formatter for each section in the container
+    :param container: :class:`~purdy.content.Code` or
+        :class:`~purdy.content.Document` object to translate
+    :param source: string, file-like object or iterable of strings to parse,
+        see :func:`~purdy.parser.Parser.iter_lines`
+    :param future_length: expected number of lines, used to size the line
+        numbers if they are turned on
+
+    :returns: yields the rendered result for each line
+    """
+    if isinstance(container, Code):
+        container = Document(container)
+
+    render_state = RenderState(container, future_length)
+    for section in container[:-1]:
+        render_state.formatter = formatter_cls(section, exceptions)
+        section.render(render_state)
+
+    code = container[-1]
+    render_state.formatter = formatter_cls(code, exceptions)
+    for index, line in enumerate(code.parser.iter_lines(source)):
+        code.render_line(render_state, line, index)
+
+        yield render_state.content
+        render_state.content = ""
 
 # =============================================================================
 
+class TokenTags(dict):
+    """Read-only lookup from any token straight to its formatter tag. A token
+    is resolved to its closest ancestor in the theme the first time it is
+    seen, the result is kept for next time. Tokens without a tag map to
+    `None`.
+
+    :param tag_map: mapping from theme tokens to tags
+    :param ancestor: function that returns the closest theme token for a
+        token, see :func:`~purdy.themes.Theme.ancestor`
+    """
+    def __init__(self, tag_map, ancestor):
+        super().__init__()
+        self.tag_map = tag_map
+        self.ancestor = ancestor
+
+    def __missing__(self, token):
+        tag = self.tag_map.get(self.ancestor(token))
+        self[token] = tag
+        return tag
+
+
+@lru_cache(maxsize=64)
+def _tag_table(key):
+    ### Returns the compiled tag table for the key built by
+    # Formatter._tag_table_key(), shared by all formatters with the same class,
+    # theme contents, and exceptions. Starts empty and is filled in by the
+    # first formatter to use it, see Formatter._compile(). Only the most
+    # recently used tables are kept
+    return {}
+
+
 class Formatter:
-    """Base class for format tools."""
+    """Base class for format tools.
+
+    Setting the class attribute `cache_lines` to True has
+    :class:`~purdy.content.Code` keep the output of each rendered line and
+    only re-render the lines that changed, see
+    :func:`~purdy.content.Code.render`. Useful for output that is rendered
+    over and over again, like in the TUI.
+
+    The `tag_map` built by :func:`Formatter._map_tag` is only built once for
+    each combination of formatter class, theme contents and exceptions, and
+    then shared. It is read-only. `tags` is a :class:`TokenTags` lookup that goes
+    straight from a part's token to its tag. Subclasses that build other
+    values in `_map_tag` list them in the `compiled_attrs` class attribute so
+    they get shared as well.
+    """
+    cache_lines = False
+    compiled_attrs = ("tag_map", )
+
     def __init__(self, section, exceptions):
-        self.tag_map = {}
         self.newline = "\n"
         self.escape = lambda x:x
 
         self.section = section
         self.exceptions = exceptions
-        self._create_tag_map()
         self.ancestor_list = section.theme.colour_map.keys()
+        self.ancestor = section.theme.ancestor
+        self._compile()
+
+    def _tag_table_key(self):
+        ### Values the tag table depends on, subclasses whose _map_tag() uses
+        # anything else need to add it
+        return (self.__class__,
+            frozenset(self.section.theme.colour_map.items()),
+            frozenset(self.exceptions.items()))
+
+    def _compile(self):
+        # Fetches the compiled tag table, creating it if needed
+        compiled = _tag_table(self._tag_table_key())
+        if not compiled:
+            self.tag_map = {}
+            self._create_tag_map()
+            self.tag_map = MappingProxyType(self.tag_map)
+
+            compiled.update({name: getattr(self, name)
+                for name in self.compiled_attrs})
+            compiled["tags"] = TokenTags(self.tag_map, self.ancestor)
+
+        self.__dict__.update(compiled)
 
     def _create_tag_map(self):
         for token, fg, bg, attrs in self.section.theme.values():
@@ -60,15 +175,15 @@ class StrFormatter(Formatter):
     # ._map_tag() method populated using {text} for any token text to be
     # inserted
     def render_code_line(self, render_state, line):
+        tags = self.tags
         for part in line.parts:
-            token = token_ancestor(part.token, self.ancestor_list)
+            marker = tags[part.token]
             token_text = self.escape(part.text)
 
-            try:
-                marker = self.tag_map[token]
-                render_state.content += marker.format(text=token_text)
-            except KeyError:
-                render_state.content += token_text
+            if marker is None:
+                render_state.write(token_text)
+            else:
+                render_state.write(marker.format(text=token_text))
 
         if line.has_newline:
-            render_state.content += self.newline
+            render_state.write(self.newline)
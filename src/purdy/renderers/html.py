@@ -1,10 +1,10 @@
 # renderers/html.py
 from html import escape as html_escape
 
-from pygments.token import Token, Whitespace
+from pygments.token import STANDARD_TYPES, Text, Token, Whitespace
 
 from purdy.content import Code, Document, RenderState
-from purdy.parser import HighlightOn, HighlightOff
+from purdy.parser import Fold, HighlightOn, HighlightOff, LineNumber
 from purdy.renderers.formatter import StrFormatter
 
 # ===========================================================================
@@ -60,6 +60,153 @@ _CODE_TAG_EXCEPTIONS = {
     HighlightOff:       '</span>',
 }
 
+# ---------------------------------------------------------------------------
+
+# Class names for purdy's own tokens and those Pygments leaves unnamed,
+# everything else uses Pygments' short names
+_PURDY_CLASSES = {
+    Token:              "tok",
+    Text:               "t",
+    HighlightOn:        "hll",
+    Fold:               "fold",
+    LineNumber:         "ln",
+}
+
+def css_class(token):
+    """Returns the short CSS class name used for a token in class based HTML.
+    Pygments' standard names are used (`k` for `Keyword`, `nf` for
+    `Name.Function`, etc.). Tokens without one get the name of their closest
+    ancestor that has one, with the rest of their name appended:
+    `Name.Function.Magic` becomes `nf-Magic`.
+
+    :param token: Pygments token to name
+    """
+    suffix = ""
+    while True:
+        name = _PURDY_CLASSES.get(token, STANDARD_TYPES.get(token))
+        if name is not None:
+            return name + suffix
+
+        suffix = "-" + token[-1] + suffix
+        token = token.parent
+
+
+def css_scope(theme):
+    """Returns the CSS class put on the <div> of each section rendered in
+    class based HTML, it scopes the rules from :func:`html_stylesheet`
+
+    :param theme: :class:`~purdy.themes.Theme` used by the section
+    """
+    return f"purdy-{theme.full_name}"
+
+
+def html_stylesheet(theme):
+    """Returns CSS rules for the classes used by class based HTML output (see
+    :func:`to_html`) of content using the given theme. The stylesheet only
+    depends on the theme, so it can be shared between any number of snippets
+    on a page.
+
+    :param theme: :class:`~purdy.themes.Theme` to generate the rules for
+    """
+    scope = css_scope(theme)
+    rules = []
+    for token, fg, bg, attrs in theme.values():
+        if token is HighlightOn and not (fg or bg or attrs):
+            # Match the inline style version if the theme doesn't say
+            bg = "ffffff"
+
+        style = ""
+        if fg:
+            style += f"color: #{fg}; "
+
+        if bg:
+            style += f"background: #{bg}; "
+
+        if "bold" in attrs:
+            style += "font-weight: bold; "
+
+        if "italic" in attrs:
+            style += "font-style: italic; "
+
+        if style:
+            rules.append(f".{scope} .{css_class(token)} {{ {style}}}\n")
+
+    return "".join(rules)
+
+# ---------------------------------------------------------------------------
+
+class HTMLClassFormatter(HTMLFormatter):
+    ### Formats using CSS class names instead of inline styles. Neighbouring
+    # parts with the same class share a single <span>
+    compiled_attrs = ("tag_map", "backgrounds")
+
+    def _create_tag_map(self):
+        # Classes with a background colour, the only ones that show on
+        # whitespace
+        self.backgrounds = set()
+        super()._create_tag_map()
+        self.backgrounds = frozenset(self.backgrounds)
+
+    def _map_tag(self, token, fg, bg, attrs, exceptions):
+        if token in exceptions:
+            self.tag_map[token] = exceptions[token]
+        elif fg or bg or attrs:
+            self.tag_map[token] = css_class(token)
+            if bg:
+                self.backgrounds.add(self.tag_map[token])
+        else:
+            self.tag_map[token] = ""
+
+    def render_code_line(self, render_state, line):
+        current = ""
+        tags = self.tags
+        for part in line.parts:
+            is_on = part.token is HighlightOn
+            if is_on or part.token is HighlightOff:
+                if current:
+                    render_state.write("</span>")
+                    current = ""
+
+                if is_on:
+                    render_state.write('<span class="hll">')
+                else:
+                    render_state.write("</span>")
+
+                continue
+
+            if not part.text:
+                continue
+
+            name = tags[part.token] or ""
+            if name != current and part.text.isspace() and \
+                    name not in self.backgrounds and \
+                    current not in self.backgrounds:
+                # Colour doesn't show on whitespace, keep the span going
+                name = current
+
+            if name != current:
+                if current:
+                    render_state.write("</span>")
+
+                if name:
+                    render_state.write(f'<span class="{name}">')
+
+                current = name
+
+            render_state.write(self.escape(part.text))
+
+        if current:
+            render_state.write("</span>")
+
+        if line.has_newline:
+            render_state.write(self.newline)
+
+
+_CLASS_TAG_EXCEPTIONS = {
+    Token:              "",
+    Whitespace:         "",
+}
+
 # ===========================================================================
 
 HTML_HEADER = """\
@@ -73,22 +220,59 @@ HTML_FOOTER = """\
 </html>
 """
 
-def to_html(container, snippet=True):
+HTML_STYLE_HEADER = """\
+<!doctype html>
+<html lang="en">
+<head>
+<style>
+"""
+
+HTML_STYLE_FOOTER = """\
+</style>
+</head>
+<body>
+"""
+
+def to_html(container, snippet=True, file=None, classes=False, source=None,
+        future_length=0):
     """Transforms tokenized content in a :class:`Code` object into a string
     representation of HTML.
 
     :param container: :class:`Code` or :class:`Document` object to translate
     :param snippet: When True [default] only show the code in a <div>,
         otherwise wrap it in full HTML document tags.
+    :param file: Optional file-like object to write the output to as it is
+        rendered, instead of returning it
+    :param classes: When True, tokens are styled with short CSS class names
+        instead of inline styles, and neighbouring tokens with the same class
+        are merged into a single <span>. The rules for the classes come from
+        :func:`html_stylesheet`, if `snippet` is False they are included in
+        the document's header. Defaults to False.
+    :param source: Optional string, file-like object or iterable of strings
+        to parse as the content of the last section, which must be an empty
+        `Code` object. Lines are rendered as soon as they are parsed, see
+        :func:`~purdy.content.Code.render_source`
+    :param future_length: expected number of lines in `source`, used to
+        size the line numbers if they are turned on
     """
     if isinstance(container, Code):
         container = Document(container)
 
-    render_state = RenderState(container)
+    render_state = RenderState(container, future_length, file)
 
     # Header
     if not snippet:
-        render_state.content += HTML_HEADER
+        if classes:
+            render_state.write(HTML_STYLE_HEADER)
+
+            themes = {css_scope(section.theme): section.theme
+                for section in container}
+            for theme in themes.values():
+                render_state.write(html_stylesheet(theme))
+
+            render_state.write(HTML_STYLE_FOOTER)
+        else:
+            render_state.write(HTML_HEADER)
 
     for section in container:
         if container.background is None:
@@ -96,16 +280,29 @@ def to_html(container, snippet=True):
         else:
             bg = container.background
 
-        render_state.content += (
-            f'<div style="background :#{bg}; overflow:auto; width:auto; '
-            'border:solid gray; border-width:.1em .1em .1em .8em; '
+        div_class = ""
+        if classes:
+            div_class = f'class="{css_scope(section.theme)}" '
+
+        render_state.write(
+            f'<div {div_class}style="background :#{bg}; overflow:auto; '
+            'width:auto; border:solid gray; border-width:.1em .1em .1em .8em; '
             'padding:.2em .6em;"><pre style="margin: 0; line-height:125%">'
         )
 
-        render_state.formatter = HTMLFormatter(section, _CODE_TAG_EXCEPTIONS)
-        section.render(render_state)
+        if classes:
+            render_state.formatter = HTMLClassFormatter(section,
+                _CLASS_TAG_EXCEPTIONS)
+        else:
+            render_state.formatter = HTMLFormatter(section,
+                _CODE_TAG_EXCEPTIONS)
+
+        if source is not None and section is container[-1]:
+            section.render_source(render_state, source)
+        else:
+            section.render(render_state)
 
     if not snippet:
-        render_state.content += HTML_FOOTER
+        render_state.write(HTML_FOOTER)
 
-    return render_state.content
+    return render_state.result()
@@ -3,30 +3,28 @@ from purdy.content import Code, Document, RenderState
 
 class PlainFormatter:
     def render_code_line(self, render_state, line):
-        result = ""
-        for part in line.parts:
-            result += part.text
+        render_state.write("".join([part.text for part in line.parts]))
 
         if line.has_newline:
-            result += "\n"
+            render_state.write("\n")
 
-        render_state.content += result
 
-
-def to_plain(container):
+def to_plain(container, file=None):
     """Renders content without any formatting.
 
     :param container: :class:`Document` or :class:`Code` content to be
         rendered
+    :param file: Optional file-like object to write the output to as it is
+        rendered, instead of returning it
 
-    :returns: rendered string
+    :returns: rendered string, or `None` if `file` was given
     """
     if isinstance(container, Code):
         container = Document(container)
 
-    render_state = RenderState(container)
+    render_state = RenderState(container, file=file)
     render_state.formatter = PlainFormatter()
     for section in container:
         section.render(render_state)
 
-    return render_state.content
+    return render_state.result()
@@ -1,13 +1,32 @@
 # renderers/rich.py
 from pygments.token import Token, Whitespace
 
-from rich.markup import escape as rich_escape
+from rich.markup import escape as rich_escape, render as rich_render
+from rich.style import Style
+from rich.text import Span, Text
 
-from purdy.parser import HighlightOn, HighlightOff
-from purdy.renderers.formatter import StrFormatter, conversion_handler
+from purdy.parser import HighlightOn, HighlightOff, token_is_a
+from purdy.renderers.formatter import (StrFormatter, TokenTags,
+    conversion_handler, stream_handler)
 
 # ===========================================================================
 
+def _markup_style(markup):
+    ### Returns the Style a markup tag applies to its {text}, or None if there
+    # isn't one
+    if "{text}" not in markup:
+        return None
+
+    spans = rich_render(markup.format(text="x")).spans
+    if not spans:
+        return None
+
+    return Style.parse(str(spans[0].style))
+
+
+_REVERSE = Style(reverse=True)
+
+
 class RichFormatter(StrFormatter):
     def __init__(self, section, exceptions):
         super().__init__(section, exceptions)
@@ -29,6 +48,71 @@ class RichFormatter(StrFormatter):
         self.tag_map[token] = f"[#{fg} {attrs}]" + r"{text}" + "[/]"
 
 
+class RichTextFormatter(RichFormatter):
+    ### Produces rich.text.Text objects instead of markup, so printing them
+    # skips Rich's markup parser and no escaping is needed
+    compiled_attrs = ("tag_map", "styles")
+
+    def __init__(self, section, exceptions):
+        super().__init__(section, exceptions)
+
+        # Wrapping can split a highlighted stretch over several lines
+        self.highlight_open = False
+
+    def _create_tag_map(self):
+        super()._create_tag_map()
+
+        # Parse the markup of each tag once, lines are built directly from
+        # these styles
+        styles = {token: _markup_style(markup)
+            for token, markup in self.tag_map.items()}
+        self.styles = TokenTags(styles, self.ancestor)
+
+    def render_code_line(self, render_state, line):
+        # Build the Text from the line's text and a span for each styled
+        # part. Highlighted stretches keep their colours and get a reverse
+        # span on top
+        styles = self.styles
+        text = []
+        spans = []
+        position = 0
+        highlight_start = 0 if self.highlight_open else None
+
+        for part in line.parts:
+            token = self.ancestor(part.token)
+
+            if token_is_a(token, HighlightOff):
+                if highlight_start is not None and highlight_start != position:
+                    spans.append(Span(highlight_start, position, _REVERSE))
+
+                highlight_start = None
+                continue
+
+            style = styles[part.token]
+            if token_is_a(token, HighlightOn):
+                style = None
+                if highlight_start is None:
+                    highlight_start = position
+
+            if part.text:
+                end = position + len(part.text)
+                if style is not None:
+                    spans.append(Span(position, end, style))
+
+                text.append(part.text)
+                position = end
+
+        self.highlight_open = highlight_start is not None
+        if self.highlight_open and highlight_start != position:
+            # Highlight runs to the end of the line
+            spans.append(Span(highlight_start, position, _REVERSE))
+
+        if line.has_newline:
+            text.append(self.newline)
+
+        render_state.write(Text("".join(text), spans=spans, end=""))
+
+
 _CODE_TAG_EXCEPTIONS = {
     Token:              "{text}",
     Whitespace:         "{text}",
@@ -40,10 +124,54 @@ _CODE_TAG_EXCEPTIONS = {
 
 # ===========================================================================
 
-def to_rich(container):
+def to_rich(container, file=None):
     """Transforms tokenized content in a :class:`Code` object into a string
     with Rich library formatting.
 
     :param container: `Code` or :class:`Document` object to render
+    :param file: Optional file-like object to write the output to as it is
+        rendered, instead of returning it
+    """
+    return conversion_handler(RichFormatter, container, _CODE_TAG_EXCEPTIONS,
+        file)
+
+
+def stream_rich(container, source, future_length=0):
+    """Generator that parses `source` as the last section of `container`
+    and yields Rich library formatted strings a line at a time. See
+    :func:`~purdy.renderers.formatter.stream_handler` for details.
+
+    :param container: `Code` or :class:`Document` object to render, last
+        section must be an empty `Code` object
+    :param source: string, file-like object or iterable of strings to parse
+    :param future_length: expected number of lines, used to size the line
+        numbers if they are turned on
+    """
+    yield from stream_handler(RichFormatter, container, source,
+        _CODE_TAG_EXCEPTIONS, future_length)
+
+
+def to_rich_text(container):
+    """Transforms tokenized content in a :class:`Code` object into a
+    :class:`rich.text.Text` object. Unlike :func:`to_rich` the result needs
+    no markup parsing when it is printed.
+
+    :param container: `Code` or :class:`Document` object to render
+    """
+    return conversion_handler(RichTextFormatter, container,
+        _CODE_TAG_EXCEPTIONS)
+
+
+def stream_rich_text(container, source, future_length=0):
+    """Generator that parses `source` as the last section of `container`
+    and yields :class:`rich.text.Text` objects a line at a time. See
+    :func:`~purdy.renderers.formatter.stream_handler` for details.
+
+    :param container: `Code` or :class:`Document` object to render, last
+        section must be an empty `Code` object
+    :param source: string, file-like object or iterable of strings to parse
+    :param future_length: expected number of lines, used to size the line
+        numbers if they are turned on
     """
-    return conversion_handler(RichFormatter, container, _CODE_TAG_EXCEPTIONS)
+    yield from stream_handler(RichTextFormatter, container, source,
+        _CODE_TAG_EXCEPTIONS, future_length)
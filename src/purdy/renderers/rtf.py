@@ -1,5 +1,4 @@
 # renderers/rtf.py
-import struct
 from copy import deepcopy
 
 from pygments.token import Token, Whitespace
@@ -12,6 +11,35 @@ from purdy.renderers.formatter import StrFormatter
 # RTF Specific Utilities
 # ===========================================================================
 
+class _RTFEscapes(dict):
+    ### str.translate() table for RTF encoding. ASCII, the RTF control
+    # characters and the Latin-1 range are filled in up front, anything else
+    # is added the first time it is seen
+    def __init__(self):
+        super().__init__((num, chr(num)) for num in range(128))
+        self.update({ord("\\"): "\\\\", ord("{"): "\\{", ord("}"): "\\}"})
+
+        for num in range(128, 257):
+            # extended ascii, use hex notation
+            self[num] = f"\\'{num:2x}"
+
+    def __missing__(self, num):
+        if num < 0x10000:
+            # Single UTF-16 word
+            escape = f"\\uc0\\u{num}"
+        else:
+            # Outside the BMP the character is written as its UTF-16
+            # surrogate pair
+            high, low = divmod(num - 0x10000, 0x400)
+            escape = f"\\uc0\\u{0xD800 + high} \\u{0xDC00 + low}"
+
+        self[num] = escape
+        return escape
+
+
+_RTF_ESCAPES = _RTFEscapes()
+
+
 class RTFFormatter(StrFormatter):
     def __init__(self, rtf_page, section, exceptions):
         self.rtf_page = rtf_page
@@ -35,50 +63,20 @@ class RTFFormatter(StrFormatter):
         self.newline = "\\\n"
         self.escape = self.rtf_encode
 
+    def _tag_table_key(self):
+        # Tags refer to colours by their index in the page's colour table
+        return super()._tag_table_key() + (
+            tuple(self.rtf_page.colour_table.items()), )
+
     @classmethod
     def rtf_encode(cls, text):
         """RTF uses a weird UTF-16 decimal escape sequence for encoding unicode.
         This method take a string and returns an RTF encoded version of it."""
-        output = []
-        data = text.encode('utf-16le')
-        length = len(data) // 2
-
-        # use struct.unpack to turn the pairs of bytes into decimal unicode
-        # escape numbers
-        parts = struct.unpack(f'<{length}H', data)
-        index = 0
-        size = len(parts)
-
-        while index < size:
-            num = parts[index]
-
-            if num <= 127:
-                # regular ascii
-                letter = chr(num)
-
-                # Escape characters that are used by RTF
-                if letter == '\\':
-                    output.append('\\\\')
-                elif letter in '{}':
-                    output.append('\\' + letter)
-                else:
-                    output.append(letter)
-            elif num <= 256:
-                # extended ascii, use hex notation
-                output.append(f"\\'{num:2x}" )
-            elif num < 55296:
-                # 0xD800 (55296) is the the boundary for two-word encoding, less
-                # than this means it is a single item
-                output.append(f"\\uc0\\u{num}")
-            else:
-                # greater than 0xD800, means two words
-                index += 1
-                next_num = parts[index]
-                output.append(f"\\uc0\\u{num} \\u{next_num}")
-
-            index += 1
-
-        return ''.join(output)
+        if text.isascii() and not ("\\" in text or "{" in text or "}" in text):
+            # Most code is plain ASCII with nothing to escape
+            return text
+
+        return text.translate(_RTF_ESCAPES)
 
     def tag_open(self, fg, bg, attrs):
         tag = ""
@@ -215,19 +213,27 @@ class RTFPage:
 
 # ===========================================================================
 
-def to_rtf(container):
+def to_rtf(container, file=None, source=None, future_length=0):
     """Transforms tokenized content in a :class:`Code` object into a string
     representation of RTF.
 
     :param container: `Code` or :class:`MultiCode` object to render
+    :param file: Optional file-like object to write the output to as it is
+        rendered, instead of returning it
+    :param source: Optional string, file-like object or iterable of strings
+        to parse as the content of the last section, which must be an empty
+        `Code` object. Lines are rendered as soon as they are parsed, see
+        :func:`~purdy.content.Code.render_source`
+    :param future_length: expected number of lines in `source`, used to
+        size the line numbers if they are turned on
     """
     if isinstance(container, Code):
         container = Document(container)
 
-    render_state = RenderState(container)
+    render_state = RenderState(container, future_length, file)
 
     page = RTFPage(container.background, container)
-    render_state.content += page.header_string()
+    render_state.write(page.header_string())
 
     for section in container:
         code_tag_exceptions = {
@@ -237,7 +243,11 @@ def to_rtf(container):
 
         render_state.formatter = RTFFormatter(page, section,
             code_tag_exceptions)
-        section.render(render_state)
 
-    render_state.content += page.footer_string()
-    return render_state.content
+        if source is not None and section is container[-1]:
+            section.render_source(render_state, source)
+        else:
+            section.render(render_state)
+
+    render_state.write(page.footer_string())
+    return render_state.result()
@@ -1,13 +1,43 @@
 # renderers/textual.py
 from pygments.token import Token, Whitespace
-from textual.content import Content
+from textual.content import Content, Span
+from textual.style import Style
 
-from purdy.parser import HighlightOn, HighlightOff, token_ancestor, token_is_a
-from purdy.renderers.formatter import conversion_handler, Formatter
+from purdy.parser import HighlightOn, HighlightOff, token_is_a
+from purdy.renderers.formatter import conversion_handler, Formatter, TokenTags
 
 # ===========================================================================
 
+def _markup_style(markup):
+    ### Returns the Style a markup tag applies to its $text, or None if there
+    # isn't one
+    if "$text" not in markup:
+        return None
+
+    spans = Content.from_markup(markup, text="x").spans
+    if not spans:
+        return None
+
+    return Style.parse(spans[0].style)
+
+
+_REVERSE = Style(reverse=True)
+
+
 class TextualFormatter(Formatter):
+    # CodeBox re-renders its whole document on every change
+    cache_lines = True
+    compiled_attrs = ("tag_map", "styles")
+
+    def _create_tag_map(self):
+        super()._create_tag_map()
+
+        # Parse the markup of each tag once, lines are built directly from
+        # these styles instead of going through Textual's markup parser
+        styles = {token: _markup_style(markup)
+            for token, markup in self.tag_map.items()}
+        self.styles = TokenTags(styles, self.ancestor)
+
     def _map_tag(self, token, fg, bg, attrs, exceptions):
         if token in exceptions:
             self.tag_map[token] = exceptions[token]
@@ -24,73 +54,54 @@ class TextualFormatter(Formatter):
         self.tag_map[token] = f"[#{fg} {attrs}]$text[/]"
 
     def render_code_line(self, render_state, line):
-        # Textual really doesn't like piecemeal creation of content or
-        # strings, and they way the code works elsewhere you can just append a
-        # close attr, but here you can't
-        #
-        # You need to construct a single string for the Content.from_markup
-        # method, which means having to be a bit hacky, creating then
-        # re-parsing the individual pieces
-
-        part_map = {}
-        counter = 0
-        markup = ""
-        highlight_on = False
+        # Build the Content from the line's text and a span for each styled
+        # part. Highlighted parts get a single reverse span instead, their
+        # own colours are ignored as reversing them looks bad
+        styles = self.styles
+        text = []
+        spans = []
+        position = 0
+        highlight_start = None
 
         for part in line.parts:
-            token = token_ancestor(part.token, self.ancestor_list)
-
-            name = f"text_{counter}"
-            dname = "$" + name
+            token = self.ancestor(part.token)
 
             if token_is_a(token, HighlightOff):
-                highlight_on = False
-
-            if highlight_on:
-                # When highlighting, ignore all other tags, reversing their
-                # colours looks bad
-                marker = dname
-            else:
-                try:
-                    # Get the tag from the general map and replace $text with
-                    # the counted version
-                    marker = self.tag_map[token]
-                    marker = marker.replace("$text", dname)
-                except KeyError:
-                    # No map tags, use just the placeholder for the content
-                    marker = dname
-
-            # Store the text for Content's kwargs and update our markup
-            # string
-            part_map[name] = part.text
-            markup += marker
-
-            counter += 1
+                if highlight_start is not None and highlight_start != position:
+                    spans.append(Span(highlight_start, position, _REVERSE))
+
+                highlight_start = None
+                continue
 
             if token_is_a(token, HighlightOn):
-                highlight_on = True
+                if highlight_start is None:
+                    highlight_start = position
+
+            if part.text:
+                end = position + len(part.text)
+                style = styles[part.token]
+                if highlight_start is None and style is not None:
+                    spans.append(Span(position, end, style))
+
+                text.append(part.text)
+                position = end
 
         if line.has_newline:
-            markup += self.newline
+            text.append(self.newline)
+            position += len(self.newline)
+
+        if highlight_start is not None and highlight_start != position:
+            # Highlight runs to the end of the line
+            spans.append(Span(highlight_start, position, _REVERSE))
 
-        # Now get Textual to render that mess
-        render_state.content += Content.from_markup(markup, **part_map)
+        render_state.write(Content("".join(text), spans))
 
     def part_to_content(self, token, value):
-        token = token_ancestor(token, self.ancestor_list)
-        part_map = {
-            "text": value,
-        }
-
-        try:
-            # Use the tag from the general map
-            markup = self.tag_map[token]
-        except KeyError:
-            # No map tags, use just the placeholder for the content
-            markup = "$text"
-
-        # Get Textual to render that mess
-        return Content.from_markup(markup, **part_map)
+        style = self.styles[token]
+        if style is None or not value:
+            return Content(value)
+
+        return Content(value, [Span(0, len(value), style)])
 
 
 _CODE_TAG_EXCEPTIONS = {
@@ -4,7 +4,8 @@ from copy import copy
 from pygments.token import (Keyword, Name, Comment, String, Error, Number,
     Operator, Generic, Token, Whitespace, Punctuation, Text, Literal)
 
-from purdy.parser import HighlightOn, HighlightOff, Fold, LineNumber
+from purdy.parser import (HighlightOn, HighlightOff, Fold, LineNumber,
+    token_ancestor)
 
 # ===========================================================================
 # Theme Class
@@ -13,9 +14,13 @@ from purdy.parser import HighlightOn, HighlightOff, Fold, LineNumber
 class Theme:
     """Encapsulates colourization theme information. Uses a dictionary
     mapping Pygments tokens to a colour code.
+
+    Token look-ups are cached, don't change `colour_map` after the theme has
+    been used for rendering.
     """
     def __init__(self, full_name, colour_map, inherit=None):
         self.full_name = full_name
+        self._ancestors = {}
 
         if inherit is not None:
             # Inherit from another theme
@@ -36,6 +41,18 @@ class Theme:
 
             yield key, fg, bg, attrs
 
+    def ancestor(self, token):
+        """Returns the closest ancestor of `token` (including the token
+        itself) that is in this theme's colour map, or the generic `Token` if
+        there isn't one. See :func:`~purdy.parser.token_ancestor`.
+        """
+        try:
+            return self._ancestors[token]
+        except KeyError:
+            result = token_ancestor(token, self.colour_map)
+            self._ancestors[token] = result
+            return result
+
 # ===========================================================================
 # Empty Theme
 # ===========================================================================
@@ -45,12 +45,13 @@ class TextSection(Section):
     def render_line(self, render_state, line, line_index):
         if render_state.doc.line_numbers_enabled:
             num = render_state.next_line_number()
-            render_state.content += render_state.formatter.part_to_content(
-                LineNumber, num)
+            render_state.write(render_state.formatter.part_to_content(
+                LineNumber, num))
 
         if isinstance(line, EscapeText):
-            render_state.content += TContent.from_markup("$text", text=line)
+            # Plain text, no need for the markup parser
+            render_state.write(TContent(line))
         else:
-            render_state.content += TContent.from_markup(line)
+            render_state.write(TContent.from_markup(line))
 
-        render_state.content += "\n"
+        render_state.write("\n")
@@ -62,8 +62,8 @@ class _CodeTypewriter:
 
             if self.typing_rs.doc.line_numbers_enabled:
                 num = self.cached_rs.next_line_number()
-                self.cached_rs.content += \
-                    self.typing_rs.formatter.part_to_content(LineNumber, num)
+                self.cached_rs.write(
+                    self.typing_rs.formatter.part_to_content(LineNumber, num))
 
             # Handle multi-line console output
             if self.is_console:
@@ -10,7 +10,7 @@ from purdy.themes import THEME_MAP
 
 # ===========================================================================
 
-RENDER_TESTS = ["rich", "html", "rtf"]
+RENDER_TESTS = ["rich", "html", "html_classes", "rtf"]
 
 # ===========================================================================
 
@@ -25,12 +25,15 @@ def code_liner(spec, newline, *args):
 # Renderer Testing
 # ===========================================================================
 
-def _doc_factory(theme=None):
+def _doc_factory(theme=None, compact=False):
     path = (Path(__file__).parent / Path("data/code.py")).resolve()
     code = Code(str(path))
     if theme is not None:
         code.theme = theme
 
+    if compact:
+        code.compact()
+
     code.highlight(2, "17:8,5")   # 3:pass, 18:while
     code.fold(6, 4)               # 7-11: __init__ method
     doc = Document(code)
@@ -40,20 +43,26 @@ def _doc_factory(theme=None):
     return doc
 
 
-def generate_rich():
-    doc = _doc_factory()
+def generate_rich(compact=False):
+    doc = _doc_factory(compact=compact)
     text = to_rich(doc)
     return text
 
 
-def generate_html():
-    doc = _doc_factory()
+def generate_html(compact=False):
+    doc = _doc_factory(compact=compact)
     text = to_html(doc, snippet=False)
     return text
 
 
-def generate_rtf():
+def generate_html_classes(compact=False):
+    doc = _doc_factory(compact=compact)
+    text = to_html(doc, snippet=False, classes=True)
+    return text
+
+
+def generate_rtf(compact=False):
     theme = THEME_MAP["rtf"]["code"]
-    doc = _doc_factory(theme)
+    doc = _doc_factory(theme, compact)
     text = to_rtf(doc)
     return text
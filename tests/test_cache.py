@@ -0,0 +1,87 @@
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+from purdy import cache as cache_module
+from purdy.cache import ParseCache, dump_lines, load_lines
+from purdy.content import Code
+from purdy.parser import LexerSpec
+
+# =============================================================================
+
+class TestParseCache(TestCase):
+    def test_serialization(self):
+        path = (Path(__file__).parent / Path("data/simple.py")).resolve()
+        code = Code(path)
+
+        data = dump_lines(code.lines)
+        result = load_lines(data, code.parser.lexer_spec)
+        self.assertEqual(code.lines, result)
+
+    def test_cache(self):
+        path = (Path(__file__).parent / Path("data/code.py")).resolve()
+        expected = Code(path).lines
+
+        with TemporaryDirectory() as tmp_dir:
+            cache = ParseCache(tmp_dir)
+
+            # Cold cache
+            code = Code(path, cache=cache)
+            self.assertEqual(expected, code.lines)
+            self.assertEqual(0, cache.hits)
+            self.assertEqual(1, cache.misses)
+
+            # Warm cache
+            code = Code(path, cache=cache)
+            self.assertEqual(expected, code.lines)
+            self.assertEqual(1, cache.hits)
+            self.assertEqual(1, cache.misses)
+
+            # Different lexer is a different entry
+            code = Code.text(path.read_text(), "plain", cache=cache)
+            self.assertEqual(1, cache.hits)
+            self.assertEqual(2, cache.misses)
+
+            # Class level default
+            Code.parse_cache = cache
+            try:
+                code = Code.text(path.read_text(), "plain")
+                self.assertEqual(2, cache.hits)
+            finally:
+                Code.parse_cache = None
+
+            # Corrupted entry is treated as a miss
+            key = cache.key(path.read_text(), LexerSpec.get_spec("py"))
+            (Path(tmp_dir) / f"{key}.json").write_text("{bad")
+            code = Code(path, cache=cache)
+            self.assertEqual(expected, code.lines)
+            self.assertEqual(3, cache.misses)
+
+            # Entries written by another version of purdy or the parser
+            # aren't used
+            for name, value in [("__version__", "0.0.0"),
+                    ("CACHE_FORMAT", 1)]:
+                original = getattr(cache_module, name)
+                setattr(cache_module, name, value)
+                try:
+                    self.assertNotEqual(key, cache.key(path.read_text(),
+                        LexerSpec.get_spec("py")))
+                finally:
+                    setattr(cache_module, name, original)
+
+            self.assertEqual(key, cache.key(path.read_text(),
+                LexerSpec.get_spec("py")))
+
+            # Clear
+            cache.clear()
+            self.assertEqual(0, cache.hits)
+            self.assertEqual([], list(Path(tmp_dir).glob("*.json")))
+
+    def test_eviction(self):
+        with TemporaryDirectory() as tmp_dir:
+            cache = ParseCache(tmp_dir, max_size=1)
+
+            # Each entry is bigger than the max, so only the latest survives
+            Code.text("x = 1\n", cache=cache)
+            Code.text("y = 2\n", cache=cache)
+            self.assertLessEqual(len(list(Path(tmp_dir).glob("*.json"))), 1)
@@ -1,9 +1,13 @@
 from copy import deepcopy
+from io import StringIO
 from pathlib import Path
+from tempfile import TemporaryDirectory
 from unittest import TestCase
 
-from purdy.content import Code, Document, PyText, RenderState, StringSection
-from purdy.parser import HighlightOn, HighlightOff, token_is_a
+from purdy.cache import ParseCache
+from purdy.content import (Code, Document, PyText, RenderState,
+    StringSection, _line_source)
+from purdy.parser import CompactLines, HighlightOn, HighlightOff, token_is_a
 from purdy.renderers.plain import to_plain
 
 # =============================================================================
@@ -193,6 +197,41 @@ class TestCode(TestCase):
         self.assertEqual("1", result.lines[0].parts[0].text)
 
 
+    def test_load_many(self):
+        data_dir = (Path(__file__).parent / Path("data")).resolve()
+        paths = [data_dir / name for name in ["code.py", "curl.con",
+            "simple.py", "count.txt"]]
+        expected = [Code(path).lines for path in paths]
+
+        # Process pool
+        codes = Code.load_many(paths, jobs=2)
+        self.assertEqual(expected, [code.lines for code in codes])
+        self.assertEqual("default_code", codes[0].theme.full_name)
+
+        # In process, keeping the compact form
+        codes = Code.load_many(paths, jobs=1, compact=True)
+        self.assertIsInstance(codes[0].lines, CompactLines)
+        self.assertEqual(expected, [list(code.lines) for code in codes])
+
+        # Reading from and filling the parse cache, including the class
+        # level one
+        with TemporaryDirectory() as tmp_dir:
+            cache = ParseCache(tmp_dir)
+            codes = Code.load_many(paths, jobs=2, cache=cache)
+            self.assertEqual(expected, [code.lines for code in codes])
+            self.assertEqual(0, cache.hits)
+            self.assertEqual(4, cache.misses)
+
+            Code.parse_cache = cache
+            try:
+                codes = Code.load_many(paths, jobs=2)
+            finally:
+                Code.parse_cache = None
+
+            self.assertEqual(expected, [code.lines for code in codes])
+            self.assertEqual(4, cache.hits)
+            self.assertEqual(4, cache.misses)
+
     def test_chunk(self):
         text = "\n".join([str(x) for x in range(0, 5)]) + "\n"
         code = Code.text(text, "plain")
@@ -215,6 +254,134 @@ class TestCode(TestCase):
         result = code.remaining_chunk()
         self.assertEqual(expected_lines, result.lines)
 
+        # Chunks share their lines, editing one doesn't change the original
+        code.current = 0
+        result = code.chunk(3)
+        self.assertIs(code.lines[0], result.lines[0])
+
+        expected_lines = deepcopy(code.lines)
+        result.replace_lines(0, 1, "changed\n")
+        result.lines.append(code.lines[4])
+        self.assertEqual("changed", result.lines[0].parts[0].text)
+        self.assertEqual(expected_lines, code.lines)
+
+    def test_edit(self):
+        path = (Path(__file__).parent / Path("data/code.py")).resolve()
+        text = path.read_text()
+        lines = text.splitlines(keepends=True)
+
+        # Change a single line, only the lines around it are re-parsed
+        code = Code(path)
+        originals = list(code.lines)
+        code.highlight(2, -1)
+        code.replace_lines(3, 1, "y = [1, 2,\n    3]\n")
+
+        edited = "".join(lines[:3]) + "y = [1, 2,\n    3]\n" + \
+            "".join(lines[4:])
+        self.assertEqual(Code.text(edited).lines, code.lines)
+        self.assertIs(originals[0], code.lines[0])
+        self.assertIs(originals[-1], code.lines[-1])
+
+        # Metadata moves with its line
+        self.assertTrue(code.meta[2].highlight)
+        self.assertNotIn(3, code.meta)
+        self.assertTrue(code.meta[len(code.lines) - 1].highlight)
+
+        # Opening a string changes everything after it
+        code = Code(path)
+        code.insert_lines(1, '"""\n')
+        edited = lines[0] + '"""\n' + "".join(lines[1:])
+        self.assertEqual(Code.text(edited).lines, code.lines)
+
+        # Delete
+        code = Code(path)
+        code.replace_lines(-2, 2, "")
+        self.assertEqual(Code.text("".join(lines[:-2])).lines, code.lines)
+
+        with self.assertRaises(IndexError):
+            code.replace_lines(len(code.lines), 1, "")
+
+        # Appending continues a line without a newline
+        code = Code.text("zero\none", "plain")
+        code.append_text(" two\nthree\n")
+        self.assertEqual(Code.text("zero\none two\nthree\n", "plain").lines,
+            code.lines)
+
+        # Lexers that don't restart re-parse everything
+        code = Code.text("x = 1\n", "pyfast")
+        code.append_text('s = """\n')
+        self.assertEqual(Code.text('x = 1\ns = """\n', "pyfast").lines,
+            code.lines)
+
+    def test_edit_console(self):
+        repl = (
+            ">>> def f(x):\n"
+            "...     if x:\n"
+            "...\n"
+            "...     pass\n"
+            "...\n"
+            '>>> s = """multi\n'
+            '... line"""\n'
+            ">>> f(3)\n"
+            "1\n"
+            ">>> 1 / 0\n"
+            "Traceback (most recent call last):\n"
+            '  File "<stdin>", line 1, in <module>\n'
+            "ZeroDivisionError: division by zero\n"
+            ">>> x = 1\n"
+        )
+        con = (
+            "$ ls\n"
+            "total 0\n"
+            "$ cat <<EOT\n"
+            "> one\n"
+            "> EOT\n"
+            "one\n"
+            '$ echo "a\n'
+            '> b"\n'
+            "a\n"
+            "b\n"
+        )
+
+        edits = [
+            # Continuation lines aren't somewhere to start over
+            ("repl", repl, 2, 1, "...\n"),
+            ("repl", repl, 3, 1, "...         return 1\n"),
+            # Nor is a prompt inside a string
+            ("repl", repl, 6, 1, ">>> y = 2\n"),
+            ("repl", repl, 5, 0, ">>> t = '''\n"),
+            # Tracebacks are lexed as one stream
+            ("repl", repl, 8, 1, "Traceback (most recent call last):\n"),
+            ("repl", repl, 12, 1, ""),
+            # Commands between output are lexed together
+            ("con", con, 4, 1, ""),
+            ("con", con, 2, 0, "$ cat <<EOT\n"),
+            ("con", con, 7, 1, "> b\n"),
+            ("con", con, 1, 1, "$ echo 'x\n"),
+        ]
+
+        for name, text, index, count, new in edits:
+            lines = text.splitlines(keepends=True)
+            code = Code.text(text, name)
+            code.replace_lines(index, count, new)
+
+            edited = "".join(lines[:index]) + new + \
+                "".join(lines[index + count:])
+            self.assertEqual(Code.text(edited, name).lines, code.lines,
+                msg=f"{name} {index} {count} {new!r}")
+
+        # A blank last line kept from the original parse gets dropped when
+        # the content is parsed again after an edit, like a full parse does
+        for name, text in [("con", "$ ls\nfoo\n$ pwd\n/tmp\n\n\n"),
+                ("md", "# Title\n\ntext\n\n# Next\n\n\n")]:
+            code = Code.text(text, name)
+            self.assertEqual("", code.lines[-1].parts[0].text)
+
+            code.replace_lines(1, 1, "bar\n")
+            edited = "".join(_line_source(line) for line in code.lines)
+            self.assertEqual(Code.text(edited, name).lines, code.lines,
+                msg=name)
+
     def test_folding(self):
         # Sample text numbers 1-10 separated by newlines
         text = "\n".join([str(x) for x in range(0, 10)]) + "\n"
@@ -236,9 +403,8 @@ class TestCode(TestCase):
         # Unfold
         code.unfold(1)
 
-        # Unfolding doesn't remove the metadata, but want to make sure nothing
-        # new was added
-        self.assertEqual(8, len(code.meta))
+        # Unfolding removes the metadata, and reading it doesn't create any
+        self.assertEqual(0, len(code.meta))
 
         self.assertFalse(code.meta[1].folded)
         self.assertFalse(code.meta[1].hidden)
@@ -266,7 +432,7 @@ class TestCode(TestCase):
 
         # Unfold when multi-folded
         code.unfold(1)
-        self.assertEqual(3, len(code.meta))
+        self.assertEqual(2, len(code.meta))
 
         self.assertFalse(code.meta[1].folded)
         self.assertFalse(code.meta[1].hidden)
@@ -277,13 +443,28 @@ class TestCode(TestCase):
 
         # Make sure all this mucking about hasn't created unnecessary sparse
         # entries
-        self.assertEqual(3, len(code.meta))
+        self.assertEqual(2, len(code.meta))
 
         # Error handling, unfold something not folded
         code.reset_metadata()
         with self.assertRaises(ValueError):
             code.unfold(0)
 
+        # Large folds are stored as ranges, edits inside them move the tail
+        code = Code.text(text * 1000, "plain")
+        code.fold(1, 9000)
+        code.insert_lines(5, "x\n")
+        self.assertEqual(9000, len(code.meta))
+        self.assertTrue(code.meta[1].folded)
+        self.assertFalse(code.meta[5].hidden)
+        self.assertTrue(code.meta[4].hidden)
+        self.assertTrue(code.meta[9001].hidden)
+        self.assertFalse(code.meta[9002].hidden)
+
+        code.unfold(1)
+        self.assertTrue(code.meta[6].hidden)
+        self.assertEqual(8996, len(code.meta))
+
     def test_highlight(self):
         # Tests the meta data portion of highlighting
         text = "zero\none\ntwo\nthree and a bit\nfour and a bit"
@@ -353,21 +534,21 @@ class TestCode(TestCase):
         # Int
         code.highlight(1)
         code.highlight_off(1)
-        self.assertEqual(1, len(code.meta))
+        self.assertEqual(0, len(code.meta))
         self.assertFalse(code.meta[1].highlight)
         code.reset_metadata()
 
         # Negative Int
         code.highlight(-1)
         code.highlight_off(-1)
-        self.assertEqual(1, len(code.meta))
+        self.assertEqual(0, len(code.meta))
         self.assertFalse(code.meta[4].highlight)
         code.reset_metadata()
 
         # Tuple (start, length)
         code.highlight( (3, 2) )
         code.highlight_off( (3, 2) )
-        self.assertEqual(2, len(code.meta))
+        self.assertEqual(0, len(code.meta))
         self.assertFalse(code.meta[3].highlight)
         self.assertFalse(code.meta[4].highlight)
         code.reset_metadata()
@@ -375,14 +556,14 @@ class TestCode(TestCase):
         # Tuple (negative start, length)
         code.highlight( (-1, 1) )
         code.highlight_off( (-1, 1) )
-        self.assertEqual(1, len(code.meta))
+        self.assertEqual(0, len(code.meta))
         self.assertFalse(code.meta[4].highlight)
         code.reset_metadata()
 
         # Partial Highlighting
         code.highlight("3:6,3")
         code.highlight_off("3:6,3")
-        self.assertEqual(1, len(code.meta))
+        self.assertEqual(0, len(code.meta))
         self.assertEqual([], code.meta[3].highlight_partial)
         code.reset_metadata()
 
@@ -390,7 +571,7 @@ class TestCode(TestCase):
         code.highlight("0-2")
         code.highlight_off("0-4")
 
-        self.assertEqual(5, len(code.meta))
+        self.assertEqual(0, len(code.meta))
         for i in range(0, 5):
             self.assertFalse(code.meta[i].highlight)
 
@@ -400,7 +581,7 @@ class TestCode(TestCase):
         code.highlight("0-2")
         code.highlight_all_off()
 
-        self.assertEqual(3, len(code.meta))
+        self.assertEqual(0, len(code.meta))
         for i in range(0, 3):
             self.assertFalse(code.meta[i].highlight)
 
@@ -480,6 +661,32 @@ class TestCode(TestCase):
         doc[0].render(rs)
         self.assertEqual(expected, rs.content)
 
+        # Overlapping, touching, empty, and past the end of the line
+        code = Code.text("three and a bit\n", "plain")
+        code.highlight("0:2,3", "0:0,3", "0:6,3", "0:9,2", "0:1,0",
+            "0:12,10")
+
+        rs = RenderState(Document(code))
+        rs.formatter = BraceFormatter()
+        code.render(rs)
+        self.assertEqual("{three} {and}{ a} {bit}\n", rs.content)
+
+        # Rendering leaves the shared lines alone
+        path = (Path(__file__).parent / Path("data/code.py")).resolve()
+        code = Code(path)
+        code.highlight(1, "4:2,5", "13:8,30")
+        original = [(line, list(line.parts)) for line in code.lines]
+
+        doc = Document(code)
+        doc.line_numbers_enabled = True
+        doc.wrap = 20
+        to_plain(doc)
+
+        self.assertEqual(Code(path).lines, code.lines)
+        for line, (expected_line, parts) in zip(code.lines, original):
+            self.assertIs(expected_line, line)
+            self.assertEqual(parts, line.parts)
+
     def test_wrapping(self):
         path = (Path(__file__).parent / Path("data/wrap.py")).resolve()
         code = Code(path)
@@ -629,3 +836,34 @@ class TestRenderState(TestCase):
 
         # Gap
         self.assertEqual("      ", rs.line_number_gap())
+
+    def test_output(self):
+        doc = Document(Code.text("a = 1\n", "py"))
+
+        # Chunks are joined when the content is read
+        rs = RenderState(doc)
+        self.assertEqual("", rs.content)
+        rs.write("one")
+        rs.write("two")
+        self.assertEqual("onetwo", rs.content)
+        rs.content += "three"
+        rs.write("four")
+        self.assertEqual("onetwothreefour", rs.content)
+
+        # Captures collect output on their own, then pass it along
+        saved = rs.begin_capture()
+        rs.write("five")
+        self.assertEqual("five", rs.content)
+        self.assertEqual(["five"], rs.end_capture(saved))
+        self.assertEqual("onetwothreefourfive", rs.content)
+
+        # Streaming to a file
+        handle = StringIO()
+        rs = RenderState(doc, file=handle)
+        rs.write("one")
+        saved = rs.begin_capture()
+        rs.write("two")
+        rs.end_capture(saved)
+        self.assertEqual("", rs.content)
+        self.assertIsNone(rs.result())
+        self.assertEqual("onetwo", handle.getvalue())
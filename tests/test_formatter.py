@@ -4,7 +4,7 @@ from pygments.token import Comment, Keyword, Name, Whitespace
 
 from purdy.content import Code, Document, RenderState
 from purdy.parser import CodePart, Parser
-from purdy.renderers.formatter import StrFormatter
+from purdy.renderers.formatter import StrFormatter, _tag_table
 from purdy.themes import Theme
 
 from shared import code_liner
@@ -75,3 +75,49 @@ class TestFormatter(TestCase):
         rs.formatter.escape = lambda x: f"<{x}>"
         section.render(rs)
         self.assertEqual(DUMMY_FORMATTED_ESCAPED, rs.content)
+
+    def test_compiled_tags(self):
+        theme = Theme("dummy", {
+            Comment: "112233",
+            Keyword: ("223344", "556677", "bold"),
+        })
+
+        code = Code.text("", "plain")
+        code.theme = theme
+        exceptions = {
+            Name: "no_percent",
+        }
+
+        # Formatters with the same class, theme, and exceptions share their
+        # read-only tag table
+        first = DummyFormatter(code, exceptions)
+        second = DummyFormatter(code, dict(exceptions))
+        self.assertIs(first.tag_map, second.tag_map)
+        self.assertIs(first.tags, second.tags)
+        with self.assertRaises(TypeError):
+            first.tag_map[Name] = "changed"
+
+        different = DummyFormatter(code, {})
+        self.assertIsNot(first.tag_map, different.tag_map)
+
+        # Tables are keyed on the theme's contents, not the object
+        code.theme = Theme("copy", theme.colour_map)
+        self.assertIs(first.tag_map, DummyFormatter(code, exceptions).tag_map)
+
+        code.theme = Theme("changed", {Comment: "445566"}, inherit=theme)
+        self.assertIsNot(first.tag_map,
+            DummyFormatter(code, exceptions).tag_map)
+
+        # Only the most recently used tables are kept
+        for num in range(_tag_table.cache_info().maxsize):
+            code.theme = Theme("many", {Comment: f"{num:06}"})
+            DummyFormatter(code, exceptions)
+
+        code.theme = theme
+        self.assertIsNot(first.tag_map,
+            DummyFormatter(code, exceptions).tag_map)
+
+        # Tokens resolve straight to the tag of their ancestor
+        expected = "text='{text}' fg:'223344' bg:'556677' attrs:'bold'"
+        self.assertEqual(expected, first.tags[Keyword.Constant])
+        self.assertIsNone(first.tags[Name])
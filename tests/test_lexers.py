@@ -0,0 +1,113 @@
+from pathlib import Path
+from unittest import TestCase
+
+from pygments.lexers import PythonLexer
+from pygments.token import Token
+
+from purdy.content import Code
+from purdy.lexers import TokenizePythonLexer
+from purdy.parser import token_ancestor
+from purdy.themes import THEME_MAP
+
+# =============================================================================
+
+def _characters(lexer, content):
+    # Returns a list of (character, token) pairs
+    return [(char, token) for token, text in lexer.get_tokens(content)
+        for char in text]
+
+
+class TestTokenizePythonLexer(TestCase):
+    def test_conformance(self):
+        # Every non-whitespace character must get the same colour as it does
+        # with Pygments in every theme
+        colour_maps = [theme.colour_map for themes in THEME_MAP.values()
+            for theme in themes.values()]
+
+        data_dir = Path(__file__).parent / Path("data")
+        for path in sorted(data_dir.glob("*.py")):
+            content = path.read_text()
+            expected = _characters(PythonLexer(stripnl=False), content)
+            result = _characters(TokenizePythonLexer(stripnl=False), content)
+
+            self.assertEqual("".join(char for char, _ in expected),
+                "".join(char for char, _ in result))
+
+            for (char, token1), (_, token2) in zip(expected, result):
+                if char.isspace():
+                    continue
+
+                for colour_map in colour_maps:
+                    self.assertEqual(token_ancestor(token1, colour_map),
+                        token_ancestor(token2, colour_map),
+                        msg=f"{path.name}: {char!r} {token1} {token2}")
+
+    def test_tokens(self):
+        content = (
+            '"""Doc"""\n'
+            'from os import path\n'
+            '@decorate\n'
+            'def __init__(self, x=None):\n'
+            '    return f"a{x!r}" + b"\\x00"\n'
+            'class Thing(Base):\n'
+            '    print(True)\n'
+        )
+
+        tokens = [(token, text) for token, text in
+            TokenizePythonLexer().get_tokens(content) if text.strip()]
+        expected = [
+            (Token.Literal.String.Doc, '"""Doc"""'),
+            (Token.Keyword.Namespace, 'from'),
+            (Token.Name.Namespace, 'os'),
+            (Token.Keyword.Namespace, 'import'),
+            (Token.Name, 'path'),
+            (Token.Name.Decorator, '@decorate'),
+            (Token.Keyword, 'def'),
+            (Token.Name.Function.Magic, '__init__'),
+            (Token.Punctuation, '('),
+            (Token.Name.Builtin.Pseudo, 'self'),
+            (Token.Punctuation, ','),
+            (Token.Name, 'x'),
+            (Token.Operator, '='),
+            (Token.Keyword.Constant, 'None'),
+            (Token.Punctuation, ')'),
+            (Token.Punctuation, ':'),
+            (Token.Keyword, 'return'),
+            (Token.Literal.String.Affix, 'f'),
+            (Token.Literal.String.Double, '"'),
+            (Token.Literal.String.Double, 'a'),
+            (Token.Literal.String.Interpol, '{'),
+            (Token.Name, 'x'),
+            (Token.Literal.String.Interpol, '!r}'),
+            (Token.Literal.String.Double, '"'),
+            (Token.Operator, '+'),
+            (Token.Literal.String.Affix, 'b'),
+            (Token.Literal.String.Double, '"'),
+            (Token.Literal.String.Escape, '\\x00'),
+            (Token.Literal.String.Double, '"'),
+            (Token.Keyword, 'class'),
+            (Token.Name.Class, 'Thing'),
+            (Token.Punctuation, '('),
+            (Token.Name, 'Base'),
+            (Token.Punctuation, ')'),
+            (Token.Punctuation, ':'),
+            (Token.Name.Builtin, 'print'),
+            (Token.Punctuation, '('),
+            (Token.Keyword.Constant, 'True'),
+            (Token.Punctuation, ')'),
+        ]
+        self.assertEqual(expected, tokens)
+
+    def test_fallback(self):
+        # Unterminated string can't be tokenized, Pygments is used instead
+        content = 'x = 1\ns = """never ends\n'
+        expected = list(PythonLexer().get_tokens(content))
+        result = list(TokenizePythonLexer().get_tokens(content))
+        self.assertEqual(expected, result)
+
+    def test_spec(self):
+        path = Path(__file__).parent / Path("data/code.py")
+        code = Code(path, "pyfast")
+        self.assertEqual(path.read_text(), "".join(
+            "".join(part.text for part in line.parts) +
+            ("\n" if line.has_newline else "") for line in code.lines))
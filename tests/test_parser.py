@@ -1,12 +1,18 @@
+import subprocess
+import sys
+
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from tempfile import TemporaryDirectory
 from unittest import TestCase
 
-from pygments.lexers import PythonConsoleLexer
+from pygments.lexers import PythonConsoleLexer, PythonLexer
 from pygments.token import Token
 
 from purdy.content import Code
-from purdy.parser import (CodeLine, CodePart, LexerSpec, Parser, PartsList,
-    token_is_a, token_ancestor)
+from purdy.parser import (CodeLine, CodePart, CompactLines, LazyLines,
+    LexerSpec, Parser, PartsList, lexer_pool, token_ancestor, token_id,
+    token_is_a)
 
 from shared import code_liner
 
@@ -23,6 +29,15 @@ class TestTokenComparison(TestCase):
         # Not equal case
         self.assertFalse( token_is_a(Token.Text, Token.Keyword) )
 
+        # Token created after first use
+        self.assertTrue( token_is_a(Token.Text.Brand.New, Token.Text) )
+        self.assertFalse( token_is_a(Token.Text, Token.Text.Brand.New) )
+
+    def test_token_id(self):
+        first = token_id(Token.Keyword)
+        self.assertEqual(first, token_id(Token.Keyword))
+        self.assertNotEqual(first, token_id(Token.Keyword.Constant))
+
     def test_ancestor(self):
         # Perfect match case
         result = token_ancestor(Token.Text, [Token.Text])
@@ -88,6 +103,58 @@ class TestLexerSpec(TestCase):
         with self.assertRaises(ValueError):
             LexerSpec.find("not_a_lexer_name")
 
+    def test_lazy_lexer(self):
+        # Dotted path is only resolved when asked for
+        spec = LexerSpec("Python", "pygments.lexers.python.PythonLexer",
+            False, "code")
+        self.assertEqual("pygments.lexers.python.PythonLexer",
+            spec.lexer_path)
+        self.assertIsNone(spec._lexer_cls)
+        self.assertEqual(PythonLexer, spec.lexer_cls)
+
+        # Class given directly
+        spec = LexerSpec("Python", PythonLexer, False, "code")
+        self.assertEqual("pygments.lexers.python.PythonLexer",
+            spec.lexer_path)
+        self.assertEqual(PythonLexer, spec.lexer_cls)
+
+        # Older keyword name for the lexer
+        spec = LexerSpec("Python", lexer_cls=PythonLexer, console=False,
+            category="code")
+        self.assertEqual(LexerSpec("Python", PythonLexer, False, "code"), spec)
+        self.assertEqual(PythonLexer, spec.lexer_cls)
+
+        with self.assertRaises(TypeError):
+            LexerSpec("Python", PythonLexer, lexer_cls=PythonLexer)
+
+        with self.assertRaises(TypeError):
+            LexerSpec("Python")
+
+        # Importing the parser doesn't import any of the lexers
+        script = ("import sys, purdy.parser; "
+            "print(any('pygments.lexers.' in name for name in sys.modules))")
+        result = subprocess.run([sys.executable, "-c", script],
+            capture_output=True, text=True, check=True)
+        self.assertEqual("False", result.stdout.strip())
+
+    def test_register(self):
+        spec = LexerSpec("Python Again", "pygments.lexers.python.PythonLexer",
+            False, "code")
+        LexerSpec.register("Again", spec, aliases=["pyagain"])
+        try:
+            self.assertEqual(spec, LexerSpec.get_spec("again"))
+            self.assertEqual(spec, LexerSpec.get_spec("pyagain"))
+            self.assertIn("again", LexerSpec.names)
+            self.assertIn("pyagain", LexerSpec.names)
+
+            code = Code.text("x = 1\n", "again")
+            self.assertEqual(Token.Name, code.lines[0].parts[0].token)
+        finally:
+            del LexerSpec.built_ins["again"]
+            del LexerSpec.aliases["pyagain"]
+            LexerSpec.names.remove("again")
+            LexerSpec.names.remove("pyagain")
+
     def test_display(self):
         # Not a full check as that really is just a doubling of the code, but
         # make sure it doesn't blow up
@@ -160,6 +227,77 @@ class TestCodeLine(TestCase):
         self.assertEqual(0, len(result.parts))
 
 
+class TestCompactLines(TestCase):
+    def test_compact(self):
+        path = (Path(__file__).parent / Path("data/code.py")).resolve()
+        code = Code(path)
+        expected = code.lines
+
+        lines = CompactLines(code.parser.lexer_spec, expected)
+        self.assertEqual(len(expected), len(lines))
+        self.assertEqual(expected, lines)
+        self.assertEqual(expected, list(lines))
+        self.assertEqual(expected[3:7], lines[3:7])
+        self.assertEqual(expected[-1], lines[-1])
+        self.assertEqual(len(expected), len(lines.newlines))
+        repr(lines)
+
+        with self.assertRaises(IndexError):
+            lines[len(expected)]
+
+        # Parts are stored in a single buffer
+        self.assertEqual(path.read_text().replace("\n", ""), lines.text)
+
+        # Code object conversion
+        code.compact()
+        self.assertIsInstance(code.lines, CompactLines)
+        self.assertEqual(expected, code.lines)
+
+
+class TestLazyLines(TestCase):
+    def test_lazy(self):
+        # Whole file in a single region
+        path = (Path(__file__).parent / Path("data/code.py")).resolve()
+        expected = Code(path).lines
+        code = Code(path, lazy=True)
+        self.assertIsInstance(code.lines, LazyLines)
+        self.assertEqual(len(expected), len(code.lines))
+        self.assertEqual(expected, code.lines)
+        repr(code.lines)
+
+        # Many small regions, only parsed when accessed
+        path = (Path(__file__).parent / Path("data/count.txt")).resolve()
+        content = ("x\n\n" + path.read_text()) * 20 + "\n\n"
+
+        with TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir) / "big.txt"
+            path.write_text(content)
+
+            expected = Code.text(content, "plain").lines
+            parser = Parser(LexerSpec.get_spec("plain"))
+            lines = LazyLines(parser, path, region_size=16)
+
+            # Only the last region gets parsed when opened
+            self.assertEqual(1, len(lines.regions))
+            self.assertEqual(len(expected), len(lines))
+
+            self.assertEqual(expected[5], lines[5])
+            self.assertEqual(2, len(lines.regions))
+
+            self.assertEqual(expected[-1], lines[-1])
+            self.assertEqual(expected[10:20], lines[10:20])
+            self.assertEqual(expected, list(lines))
+
+            with self.assertRaises(IndexError):
+                lines[len(expected)]
+
+            # Empty file
+            path.write_text("")
+            lines = LazyLines(parser, path)
+            self.assertEqual(0, len(lines))
+            self.assertEqual([], list(lines))
+
+
 class TestParser(TestCase):
     def test_newline_handling(self):
         parser = Parser(LexerSpec.get_spec("py"))
@@ -294,6 +432,89 @@ class TestParser(TestCase):
         parser.parse(content, result)
         self.assertEqual(expected, result.lines)
 
+    def test_iter_lines(self):
+        path = (Path(__file__).parent / Path("data/code.py")).resolve()
+        content = path.read_text()
+        parser = Parser(LexerSpec.get_spec("py"))
+        expected = Code(path).lines
+
+        # String source
+        self.assertEqual(expected, list(parser.iter_lines(content)))
+
+        # File source
+        with open(path) as handle:
+            self.assertEqual(expected, list(parser.iter_lines(handle)))
+
+        # Chunked source with small batches, use a line oriented lexer so
+        # batch boundaries don't matter
+        content = "one\n\n\ntwo\nthree\n\nfour"
+        parser = Parser(LexerSpec.get_spec("plain"))
+        expected = Code.text(content, "plain").lines
+
+        chunks = [content[i:i + 3] for i in range(0, len(content), 3)]
+        result = list(parser.iter_lines(chunks, batch_size=4))
+        self.assertEqual(expected, result)
+
+    def test_plain(self):
+        # Plain text skips Pygments, results must be the same as when it
+        # goes through the lexer
+        fast = Parser(LexerSpec.get_spec("plain"))
+        slow = Parser(LexerSpec.get_spec("plain"))
+        slow.plain = False
+        self.assertTrue(fast.plain)
+
+        for content in ["", "\n", "\n\n", "one", "one\n", "one\n\n",
+                "\n\none\n\ntwo", "\ufeffone\n", "one\r\ntwo\rthree\r",
+                " \t \n\n  two  \n"]:
+            expected = list(slow.iter_lines(content))
+            result = list(fast.iter_lines(content))
+            self.assertEqual(expected, result, msg=repr(content))
+
+    def test_coalesce(self):
+        path = (Path(__file__).parent / Path("data/code.py")).resolve()
+        content = path.read_text() + 'x = "a\\tb" # one  # two\n'
+        spec = LexerSpec.get_spec("py")
+
+        expected = list(Parser(spec).iter_lines(content))
+        result = list(Parser(spec, coalesce=True).iter_lines(content))
+        self.assertEqual(len(expected), len(result))
+        self.assertLess(sum(len(line.parts) for line in result),
+            sum(len(line.parts) for line in expected))
+
+        for before, after in zip(expected, result):
+            # Same text with the same token for every character
+            self.assertEqual(
+                [(part.token, char) for part in before.parts
+                    for char in part.text],
+                [(part.token, char) for part in after.parts
+                    for char in part.text],
+            )
+            self.assertEqual(before.parts.text_length,
+                after.parts.text_length)
+
+            for first, second in zip(after.parts, after.parts[1:]):
+                if first.token != second.token:
+                    continue
+
+                # Only parts that are kept separate on purpose remain
+                self.assertTrue(token_is_a(first.token, Token.Punctuation)
+                    or first.text.isspace() != second.text.isspace())
+
+        # Class level default
+        self.assertFalse(Parser.coalesce)
+        Parser.coalesce = True
+        try:
+            self.assertEqual(result, Code.text(content).lines)
+        finally:
+            Parser.coalesce = False
+
+        # Prompts are left alone
+        spec = LexerSpec.get_spec("repl")
+        content = ">>> x = 1\n>>> print(x)\n1\n"
+        expected = list(Parser(spec).iter_lines(content))
+        result = list(Parser(spec, coalesce=True).iter_lines(content))
+        self.assertEqual(expected, result)
+
     def test_after_newline(self):
         # Some lexers aren't line oriented so you can end up with stuff after
         # a \n character
@@ -335,3 +556,45 @@ class TestParser(TestCase):
         result = Code.text("", "repl")
         parser.parse(content, result)
         self.assertEqual(expected, result.lines)
+
+    def test_lexer_pool(self):
+        lexer_pool.clear()
+
+        # Instances get returned to the pool and re-used
+        with lexer_pool.lexer(PythonConsoleLexer) as first:
+            # Nested use gets a different instance
+            with lexer_pool.lexer(PythonConsoleLexer) as second:
+                self.assertIsNot(first, second)
+
+        with lexer_pool.lexer(PythonConsoleLexer) as third:
+            self.assertIn(third, (first, second))
+
+        # Re-used lexers give the same results
+        content = ">>> x = 1\n>>> print(x)\n1\n"
+        expected = Code.text(content, "repl").lines
+        self.assertEqual(expected, Code.text(content, "repl").lines)
+
+        # Parsing from multiple threads
+        with ThreadPoolExecutor(4) as executor:
+            results = list(executor.map(
+                lambda text: Code.text(text, "repl").lines, [content] * 20))
+
+        for result in results:
+            self.assertEqual(expected, result)
+
+        # Parses sharing a Parser don't mix up their lines, even when they
+        # are interleaved. The multi-line comment token leaves a partial
+        # line behind when the first parse pauses
+        content = "/* a\nb\nc\nd */ p { color: red; }\nq { }\n"
+        other = "a { }\nb { margin: 0; }\ni { }\n"
+        parser = Code.text("", "css").parser
+        first = parser.iter_lines(content)
+        second = parser.iter_lines(other)
+        first_lines = [next(first)]
+        second_lines = list(second)
+        first_lines.extend(first)
+        self.assertEqual(Code.text(content, "css").lines, first_lines)
+        self.assertEqual(Code.text(other, "css").lines, second_lines)
+
+        self.assertLessEqual(len(lexer_pool.free[PythonConsoleLexer]),
+            lexer_pool.max_free)
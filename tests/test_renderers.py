@@ -1,10 +1,40 @@
+import re
+
+from io import StringIO
 from pathlib import Path
+from tempfile import TemporaryDirectory
 from unittest import TestCase
 
+from pygments.token import Keyword, Name, Text
+from rich.console import Console
+
+from purdy.cmds.arg_helpers import count_lines
+from purdy.content import Code, Document, RenderState, StringSection
+from purdy.parser import HighlightOn
+from purdy.renderers.ansi import stream_ansi, to_ansi
+from purdy.renderers.formatter import conversion_handler
+from purdy.renderers.html import css_class, html_stylesheet, to_html
+from purdy.renderers.plain import to_plain
+from purdy.renderers.rich import (RichFormatter, _CODE_TAG_EXCEPTIONS,
+    stream_rich, stream_rich_text, to_rich, to_rich_text)
+from purdy.renderers.rtf import to_rtf
+from purdy.themes import THEME_MAP, Theme
+
 import shared
 
 # =============================================================================
 
+class CountingFormatter(RichFormatter):
+    ### Caches lines and counts how many get rendered
+    cache_lines = True
+    count = 0
+
+    def render_code_line(self, render_state, line):
+        CountingFormatter.count += 1
+        super().render_code_line(render_state, line)
+
+# =============================================================================
+
 class TestRenderers(TestCase):
     def test_renderers(self):
         compare_dir = Path(__file__).parent / Path("compare")
@@ -26,3 +56,279 @@ class TestRenderers(TestCase):
             except AssertionError: # pragma: no cover
                 print(f"*** Failed when testing {name}")
                 raise
+
+    def test_compact_renderers(self):
+        # Rendering a compacted Code object gives the same results
+        for name in shared.RENDER_TESTS:
+            fn = getattr(shared, f"generate_{name}")
+            expected = fn()
+            self.assertEqual(expected, fn(compact=True))
+
+    def test_file_output(self):
+        doc = shared._doc_factory()
+        renderers = [to_plain, to_rich, to_rtf, to_html,
+            lambda *args, **kwargs: to_html(*args, snippet=False, **kwargs)]
+
+        # Small batches so that the output gets flushed part way through
+        flush_size = RenderState.flush_size
+        RenderState.flush_size = 10
+        try:
+            for renderer in renderers:
+                handle = StringIO()
+                self.assertIsNone(renderer(doc, file=handle))
+                self.assertEqual(renderer(doc), handle.getvalue())
+
+            # Rendering the content as it is parsed
+            path = (Path(__file__).parent / Path("data/code.py")).resolve()
+            for renderer in [to_rtf, to_html]:
+                code = Code.text("", "py")
+                code.highlight(2, "17:8,5")
+                code.fold(6, 4)
+                streamed = Document(code)
+                streamed.wrap = 80
+                streamed.line_numbers_enabled = True
+                streamed.starting_line_number = 5
+
+                handle = StringIO()
+                with open(path) as source:
+                    renderer(streamed, file=handle, source=source,
+                        future_length=34)
+
+                self.assertEqual(renderer(doc), handle.getvalue())
+                self.assertEqual([], code.lines)
+        finally:
+            RenderState.flush_size = flush_size
+
+    def test_html_classes(self):
+        # Class names
+        self.assertEqual("k", css_class(Keyword))
+        self.assertEqual("nf", css_class(Name.Function))
+        self.assertEqual("t", css_class(Text))
+        self.assertEqual("hll", css_class(HighlightOn))
+        self.assertEqual("nf-Foo-Bar", css_class(Name.Function.Foo.Bar))
+
+        theme = THEME_MAP["default"]["code"]
+        css = html_stylesheet(theme)
+        self.assertIn(".purdy-default_code .k { color: #dd88dd; }\n", css)
+        self.assertIn(".purdy-default_code .hll { background: #ffffff; }\n",
+            css)
+
+        # Same class parts share a span, whitespace joins the open span
+        code = Code.text("x = y + z  # a\n", "py")
+        code.highlight("0:4,1")
+        result = to_html(code, classes=True)
+        self.assertTrue(result.startswith(
+            '<div class="purdy-default_code" style='))
+        self.assertIn('<span class="n">x </span><span class="o">= </span>'
+            '<span class="hll"><span class="n">y</span></span> '
+            '<span class="o">+ </span><span class="n">z  </span>'
+            '<span class="c"># a</span>\n', result)
+
+    def test_stream(self):
+        path = (Path(__file__).parent / Path("data/code.py")).resolve()
+
+        doc = shared._doc_factory()
+        expected = to_rich(doc)
+
+        # Build the same document but with an empty Code object
+        code = Code.text("", "py")
+        code.highlight(2, "17:8,5")
+        code.fold(6, 4)
+        doc = Document(code)
+        doc.wrap = 80
+        doc.line_numbers_enabled = True
+        doc.starting_line_number = 5
+
+        with open(path) as handle:
+            result = list(stream_rich(doc, handle, future_length=34))
+
+        self.assertEqual(expected, "".join(result))
+
+        # Streamed lines aren't kept
+        self.assertEqual(34, len(result))
+        self.assertEqual([], code.lines)
+
+        # Line numbers are sized the same as rendering the whole file, even
+        # when the last line has no newline
+        with TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir) / "nonewline.py"
+            path.write_text("".join(f"a{num}\n" for num in range(8)) + "a8")
+
+            code = Code(path)
+            doc = Document(code)
+            doc.line_numbers_enabled = True
+            expected = to_rich(doc)
+
+            doc = Document(Code.text("", "py"))
+            doc.line_numbers_enabled = True
+            with open(path) as handle:
+                result = list(stream_rich(doc, handle,
+                    future_length=count_lines(path)))
+
+        self.assertEqual(9, len(result))
+        self.assertEqual(expected, "".join(result))
+
+    def test_rich_text(self):
+        def output(content):
+            handle = StringIO()
+            console = Console(file=handle, force_terminal=True, width=100,
+                color_system="truecolor", highlight=False)
+            console.print(content, end="")
+            return handle.getvalue()
+
+        # Printing the Text gives the same result as printing the markup
+        doc = shared._doc_factory()
+        expected = output(to_rich(doc))
+        result = to_rich_text(doc)
+        self.assertEqual(to_plain(doc), result.plain)
+        self.assertEqual(expected, output(result))
+
+        # Same for streaming
+        code = Code.text("", "py")
+        code.highlight(2, "17:8,5")
+        code.fold(6, 4)
+        doc = Document(code)
+        doc.wrap = 80
+        doc.line_numbers_enabled = True
+        doc.starting_line_number = 5
+
+        path = (Path(__file__).parent / Path("data/code.py")).resolve()
+        with open(path) as handle:
+            result = list(stream_rich_text(doc, handle, future_length=34))
+
+        self.assertEqual(34, len(result))
+        self.assertEqual(expected, "".join(output(line) for line in result))
+
+        # Highlighting split by wrapping continues on the next line
+        code = Code.text("alpha beta gamma delta\n", "py")
+        code.highlight(0)
+        doc = Document(code)
+        doc.wrap = 12
+        result = to_rich_text(doc)
+        self.assertEqual(["alpha beta ", "gamma delta"],
+            [result.plain[span.start:span.end] for span in result.spans
+                if span.style.reverse])
+
+        # Documents mixing string and code sections
+        doc = Document([StringSection("hello\n"), Code.text("x = 1\n")])
+        result = to_rich_text(doc)
+        self.assertEqual("hello\nx = 1\n", result.plain)
+        self.assertEqual(output(to_rich(doc)), output(result))
+
+        # Text that looks like markup is left alone
+        source = 'x = "[bold]:copyright: \\[i]"\n'
+        self.assertEqual(source, to_rich_text(Code.text(source, "py")).plain)
+
+    def test_ansi(self):
+        doc = shared._doc_factory()
+        result = to_ansi(doc)
+        self.assertEqual(to_plain(doc), re.sub(r"\x1b\[[0-9;]*m", "", result))
+
+        # Each styled part gets its own escape sequence, highlighting adds
+        # reverse to it
+        self.assertIn("\x1b[38;2;221;136;221mdef\x1b[0m ", result)
+        self.assertIn("\x1b[7;38;2;221;136;221mpass\x1b[0m", result)
+
+        # Colours get mapped to the closest available for other depths
+        self.assertIn("\x1b[38;5;176mdef\x1b[0m ", to_ansi(doc, "256"))
+        self.assertIn("\x1b[95mdef\x1b[0m ", to_ansi(doc, "16"))
+
+        with self.assertRaises(ValueError):
+            to_ansi(doc, "8")
+
+        # Three digit colours are expanded
+        code = Code.text("def x(): pass\n", "py")
+        code.theme = Theme("short", {Keyword: ("d8d", "000", "")},
+            inherit=THEME_MAP["default"]["code"])
+        self.assertIn("\x1b[38;2;221;136;221;48;2;0;0;0mdef\x1b[0m ",
+            to_ansi(code))
+
+        # Writing to a file
+        handle = StringIO()
+        self.assertIsNone(to_ansi(doc, file=handle))
+        self.assertEqual(result, handle.getvalue())
+
+        # Streaming
+        code = Code.text("", "py")
+        code.highlight(2, "17:8,5")
+        code.fold(6, 4)
+        doc = Document(code)
+        doc.wrap = 80
+        doc.line_numbers_enabled = True
+        doc.starting_line_number = 5
+
+        path = (Path(__file__).parent / Path("data/code.py")).resolve()
+        with open(path) as handle:
+            lines = list(stream_ansi(doc, handle, future_length=34))
+
+        self.assertEqual(result, "".join(lines))
+
+    def test_line_cache(self):
+        doc = shared._doc_factory()
+        code = doc[0]
+        expected = to_rich(doc)
+
+        def render():
+            CountingFormatter.count = 0
+            return conversion_handler(CountingFormatter, doc,
+                _CODE_TAG_EXCEPTIONS)
+
+        # First render fills the cache, second re-uses all of it
+        self.assertEqual(expected, render())
+        self.assertLess(0, CountingFormatter.count)
+        self.assertEqual(expected, render())
+        self.assertEqual(0, CountingFormatter.count)
+
+        # Only changed lines get rendered again
+        code.highlight(4)
+        result = render()
+        self.assertEqual(1, CountingFormatter.count)
+        self.assertEqual(to_rich(doc), result)
+
+        code.replace_lines(0, 1, "# changed\n")
+        result = render()
+        self.assertEqual(1, CountingFormatter.count)
+        self.assertEqual(to_rich(doc), result)
+
+        code.reset_metadata()
+        result = render()
+        self.assertEqual(to_rich(doc), result)
+
+        # Changing the list of lines directly is noticed
+        other = Code.text("zzz = 9\n", "py")
+        code.lines[0] = other.lines[0]
+        result = render()
+        self.assertEqual(1, CountingFormatter.count)
+        self.assertEqual(to_rich(doc), result)
+
+        del code.lines[1]
+        result = render()
+        self.assertEqual(to_rich(doc), result)
+
+        # Equal exceptions in a different dictionary still hit the cache
+        CountingFormatter.count = 0
+        result = conversion_handler(CountingFormatter, doc,
+            dict(_CODE_TAG_EXCEPTIONS))
+        self.assertEqual(0, CountingFormatter.count)
+        self.assertEqual(to_rich(doc), result)
+
+        # Compacted lines are new objects on every access, they still hit
+        # the cache until they're edited
+        code.compact()
+        expected = to_rich(doc)
+        self.assertEqual(expected, render())
+        self.assertEqual(0, CountingFormatter.count)
+        self.assertEqual(expected, render())
+        self.assertEqual(0, CountingFormatter.count)
+
+        code.replace_lines(1, 1, "# changed again\n")
+        result = render()
+        self.assertEqual(1, CountingFormatter.count)
+        self.assertEqual(to_rich(doc), result)
+
+        # Changing render settings empties the cache
+        doc.wrap = None
+        count = len(code.lines)
+        result = render()
+        self.assertEqual(count, CountingFormatter.count)
+        self.assertEqual(to_rich(doc), result)
@@ -57,6 +57,16 @@ class TestRTF(TestCase):
         c = chr(257)
         self.assertEqual(r"\uc0\u257", RTFFormatter.rtf_encode(c))
 
-        # Unicode above 0xD800 is two words
+        # Unicode outside the BMP is two words
         c = "😂"
         self.assertEqual(r"\uc0\u55357 \u56834", RTFFormatter.rtf_encode(c))
+
+        # Characters above the surrogate range that fit in one word are only
+        # one word
+        c = chr(0xE000) + "a"
+        self.assertEqual(r"\uc0\u57344a", RTFFormatter.rtf_encode(c))
+
+        # Mixed
+        text = "{é} 😂\\"
+        self.assertEqual(r"\{\'e9\} \uc0\u55357 \u56834\\",
+            RTFFormatter.rtf_encode(text))
@@ -1,6 +1,6 @@
 from unittest import TestCase
 
-from pygments.token import Keyword, Comment
+from pygments.token import Keyword, Comment, Token
 
 from purdy.themes import Theme
 
@@ -29,3 +29,13 @@ class TestThemes(TestCase):
         ]
         result = list(theme.values())
         self.assertEqual(expected, result)
+
+    def test_ancestor(self):
+        theme = Theme("first", {Comment: "778899"})
+
+        self.assertEqual(Comment, theme.ancestor(Comment))
+        self.assertEqual(Comment, theme.ancestor(Comment.Single))
+        self.assertEqual(Token, theme.ancestor(Keyword))
+
+        # Cached result
+        self.assertEqual(Comment, theme.ancestor(Comment.Single))